@@ -1,152 +1,160 @@
 from customtkinter import *
 from datetime import datetime, timedelta
-from apscheduler.schedulers.background import BackgroundScheduler
 import tkinter.messagebox as mb
 import tkinter as tk
+from tkinter import filedialog
 import threading
-import time
-import re
-import requests
-import json
 import os
-from bs4 import BeautifulSoup
+from zendesk_engine import *
+
+
+# --- Virtualized list view ---
+class VirtualList(tk.Frame):
+    # A Listbox that only ever holds the rows on screen. Items come from load_items()
+    # (a list of references, e.g. registry jobs) and are formatted as they scroll into
+    # view, so 50k jobs cost a list copy per refresh rather than 50k widget rows.
+    def __init__(self, master, load_items, format_row, width=90, height=6):
+        super().__init__(master)
+        self.load_items = load_items
+        self.format_row = format_row
+        self.height = height
+        self.offset = 0
+        self.query = ""
+        self._items = []
+        self._selected = None
+        self._refresh_pending = False
+
+        self.scrollbar = tk.Scrollbar(self, command=self._on_scrollbar)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.listbox = tk.Listbox(self, width=width, height=height, exportselection=False)
+        self.listbox.pack(side=tk.LEFT, fill=tk.BOTH)
+        self.listbox.bind("<<ListboxSelect>>", self._remember_selection)
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            self.listbox.bind(sequence, self._on_wheel)
+        self.listbox.bind("<Prior>", lambda e: self._scroll_by(-self.height))
+        self.listbox.bind("<Next>", lambda e: self._scroll_by(self.height))
+
+    def refresh(self):
+        self._refresh_pending = False
+        items = self.load_items()
+        if self.query:
+            items = [item for item in items if self.query in self.format_row(item).lower()]
+        self._items = items
+        self._draw()
+
+    def request_refresh(self):
+        # Usable from worker threads: only sets a flag, so no Tk call happens off the
+        # main thread. poll_wake_requests picks it up; a burst collapses into one refresh
+        self._refresh_pending = True
+
+    def refresh_if_requested(self):
+        if self._refresh_pending:
+            self.refresh()
+
+    def set_query(self, query):
+        self.query = query.strip().lower()
+        self.offset = 0
+        self.refresh()
+
+    def selected_item(self):
+        sel = self.listbox.curselection()
+        if sel and self.offset + sel[0] < len(self._items):
+            return self._items[self.offset + sel[0]]
+        return None
+
+    def _draw(self):
+        total = len(self._items)
+        self.offset = max(0, min(self.offset, total - self.height))
+        visible = self._items[self.offset:self.offset + self.height]
+        self.listbox.delete(0, tk.END)
+        if visible:
+            self.listbox.insert(tk.END, *(self.format_row(item) for item in visible))
+        for i, item in enumerate(visible):
+            if item is self._selected:
+                self.listbox.selection_set(i)
+        if total:
+            self.scrollbar.set(self.offset / total, min(1.0, (self.offset + self.height) / total))
+        else:
+            self.scrollbar.set(0, 1)
+
+    def _remember_selection(self, event=None):
+        self._selected = self.selected_item()
+
+    def _scroll_by(self, rows):
+        self.offset += rows
+        self._draw()
+        return "break"
 
+    def _on_scrollbar(self, action, value, unit=None):
+        if action == "moveto":
+            self.offset = int(float(value) * len(self._items))
+            self._draw()
+        elif action == "scroll":
+            self._scroll_by(int(value) * (self.height if unit == "pages" else 1))
+
+    def _on_wheel(self, event):
+        return self._scroll_by(-3 if event.num == 4 or event.delta > 0 else 3)
 
-REAL_USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/138.0.0.0 Safari/537.36"
 
-# Global tracker of scheduled times
-scheduled_queue_times = []
 def schedule_all_jobs():
-    if not job_queue:
+    if not registry.count("queue"):
         mb.showinfo("Queue Empty", "There are no jobs in the queue to schedule.")
         return
 
     interval_text = interval_option.get()
     interval_minutes = 15 if "15" in interval_text else 30
-    now = datetime.now().replace(second=0, microsecond=0)
-
-    # ✅ Use scheduled_queue_times to avoid overlap
-    future_times = [t for t in scheduled_queue_times if isinstance(t, datetime) and t > now]
-    latest_time = max(future_times) if future_times else now
-
-    # ✅ Force round up to avoid overlap
-    latest_time_plus_one = latest_time + timedelta(minutes=1)
-
-    # ✅ Get next clean interval after the latest time
-    start_time = get_next_interval_time(interval_minutes, after=latest_time_plus_one)
-
-    for i, job in enumerate(job_queue):
-        run_time = start_time + timedelta(minutes=i * interval_minutes)
-        job["time"] = run_time
-        job_id = f"{job['ticket']}_{run_time.strftime('%Y%m%d%H%M')}"
-        job["job_id"] = job_id
-
-        scheduler.add_job(
-            send_message_to_ticket,
-            "date",
-            run_date=run_time,
-            args=[
-                email_entry.get().strip(),
-                password_entry.get().strip(),
-                job["ticket"],
-                job["message"],
-                job.get("last_comment", ""),
-                job["check_last"],
-                job["solve_ticket"],
-                job["public_reply"],
-            ],
-            id=job_id,
-            replace_existing=True,
-        )
+    capacity = int(slot_capacity_option.get().split()[0])
 
-        scheduled_jobs.append(job)
-        scheduled_times.append(run_time)
-        scheduled_queue_times.append(run_time)  # ✅ Track for future scheduling
+    schedule_queue(interval_minutes, capacity, slot_jitter_var.get())
+    queue_view.refresh()
+    scheduled_view.refresh()
 
-        scheduled_listbox.insert(
-            tk.END,
-            f"📤 {run_time.strftime('%H:%M')} → Ticket: {job['ticket']} | "
-            f"Solve: {'Yes' if job['solve_ticket'] else 'No'} | "
-            f"Public: {'Yes' if job['public_reply'] else 'No'} | "
-            f"Check Last: {'Yes' if job['check_last'] else 'No'}"
-        )
 
-    job_queue.clear()
-    queue_listbox.delete(0, tk.END)
-
-
-def get_next_interval_time(interval_minutes, after=None):
-    now = datetime.now().replace(second=0, microsecond=0)
-    base_time = after if after and after > now else now
+def job_row(job, kind):
+    ticket = ticket_label(job.ticket, job.account)
+    flags = (
+        f"Solve: {'Yes' if job.solve_ticket else 'No'} | "
+        f"Public: {'Yes' if job.public_reply else 'No'} | "
+        f"Check Last: {'Yes' if job.check_last else 'No'}"
+    )
+    if kind == "queue":
+        return f"📝 Ticket: {ticket} | {flags}"
+    if kind == "manual":
+        return f"Manual: {ticket} at {job.time.strftime('%H:%M')} | {flags}"
+    return f"📤 {job.time.strftime('%H:%M')} → Ticket: {ticket} | {flags}"
 
-    remainder = base_time.minute % interval_minutes
-    if remainder == 0 and base_time > now:
-        return base_time
-    else:
-        minutes_to_add = interval_minutes - remainder if remainder else interval_minutes
-        return base_time + timedelta(minutes=minutes_to_add)
 
+def render_job_lists():
+    for view in list_views:
+        view.refresh()
 
 
-def save_telegram_settings(token: str, chat_id: str):
-    try:
-        with open("telegram_config.json", "w") as f:
-            json.dump({"token": token, "chat_id": chat_id}, f)
-        print("[TELEGRAM] Settings saved.")
-    except Exception as e:
-        print(f"[ERROR] Could not save Telegram settings: {e}")
+def load_telegram_settings():
+    config = load_telegram_settings_file()
+    telegram_token_entry.insert(0, config.get("token", ""))
+    telegram_chatid_entry.insert(0, config.get("chat_id", ""))
 
 
-def load_telegram_settings():
-    try:
-        with open("telegram_config.json", "r") as f:
-            config = json.load(f)
-            telegram_token_entry.insert(0, config.get("token", ""))
-            telegram_chatid_entry.insert(0, config.get("chat_id", ""))
-        print("[TELEGRAM] Settings loaded.")
-    except FileNotFoundError:
-        print("[TELEGRAM] No saved settings found.")
-    except Exception as e:
-        print(f"[ERROR] Could not load Telegram settings: {e}")
+def sync_settings(event=None):
+    # Keep the engine's copies current so worker threads never read Tk widgets
+    set_credentials(email_entry.get().strip(), password_entry.get().strip(), account_option.get())
+    telegram_settings.update(
+        token=telegram_token_entry.get().strip(),
+        chat_id=telegram_chatid_entry.get().strip(),
+    )
 
 
-# --- Telegram Functions ---
-def send_telegram_message(bot_token: str, chat_id: str, text: str) -> bool:
-    if not bot_token or not chat_id:
-        print("[TELEGRAM] Bot token or chat ID missing.")
-        return False
-    url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
-    payload = {"chat_id": chat_id, "text": text}
-    try:
-        res = requests.post(url, data=payload, timeout=10)
-        if res.status_code != 200:
-            print(f"[TELEGRAM ERROR] Status {res.status_code}: {res.text}")
-            return False
-        else:
-            print("[TELEGRAM] Message sent.")
-            return True
-    except Exception as e:
-        print(f"[TELEGRAM EXCEPTION] {e}")
-        return False
+def select_account(name):
+    # The email/password fields always edit the selected account
+    account = accounts.get(name)
+    email_entry.delete(0, tk.END)
+    email_entry.insert(0, account.email)
+    password_entry.delete(0, tk.END)
+    password_entry.insert(0, account.password)
 
 
-def fetch_chat_id_from_token(bot_token: str):
-    try:
-        url = f"https://api.telegram.org/bot{bot_token}/getUpdates"
-        response = requests.get(url, timeout=10)
-        if response.status_code == 200:
-            updates = response.json()
-            print("Updates:", updates)  # Debug print
-            messages = updates.get("result", [])
-            if messages:
-                return messages[-1]["message"]["chat"]["id"]
-            else:
-                print("[Chat ID] No messages found in updates.")
-        else:
-            print(f"[Chat ID Error] Status {response.status_code}: {response.text}")
-    except Exception as e:
-        print(f"[Chat ID Exception] {e}")
-    return None
+def selected_account():
+    return accounts.get(account_option.get())
 
 
 def test_telegram():
@@ -154,331 +162,136 @@ def test_telegram():
     if not bot_token:
         mb.showerror("Missing Token", "Please enter your Telegram bot token first.")
         return
-    chat_id = fetch_chat_id_from_token(bot_token)
-    if not chat_id:
-        mb.showerror(
-            "No Chat Found",
-            "Could not fetch your chat ID.\n\nMake sure:\n• You’ve started a conversation with your bot\n• Your token is correct",
-        )
-        return
-    telegram_chatid_entry.delete(0, tk.END)
-    telegram_chatid_entry.insert(0, str(chat_id))
-    success = send_telegram_message(
-        bot_token, str(chat_id), "✅ Test successful! Your bot is connected."
-    )
-    if success:
-        save_telegram_settings(bot_token, str(chat_id))
-        mb.showinfo(
-            "Success", "✅ Telegram test message sent!\nChat ID has been auto-filled."
-        )
-    else:
-        mb.showerror("Failed", "Bot token might be wrong or blocked by Telegram.")
-
-
-# --- Scheduler setup ---
-scheduler = BackgroundScheduler()
-scheduled_jobs = []
-job_queue = []
-scheduled_times = []
-manual_jobs = []
-sent_log = []
-
-
-# --- HTML Cleaning and Formatting ---
-def clean_html(raw_html):
-    soup = BeautifulSoup(raw_html, "html.parser")
-    return soup.get_text(separator="\n").strip()
 
+    def work():
+        chat_id = fetch_chat_id_from_token(bot_token)
+        if not chat_id:
+            return None, False
+        success = send_telegram_message(
+            bot_token, str(chat_id), "✅ Test successful! Your bot is connected."
+        )
+        return chat_id, success
+
+    def done(result):
+        chat_id, success = result
+        if not chat_id:
+            mb.showerror(
+                "No Chat Found",
+                "Could not fetch your chat ID.\n\nMake sure:\n• You’ve started a conversation with your bot\n• Your token is correct",
+            )
+            return
+        telegram_chatid_entry.delete(0, tk.END)
+        telegram_chatid_entry.insert(0, str(chat_id))
+        sync_settings()
+        if success:
+            save_telegram_settings(bot_token, str(chat_id))
+            mb.showinfo(
+                "Success", "✅ Telegram test message sent!\nChat ID has been auto-filled."
+            )
+        else:
+            mb.showerror("Failed", "Bot token might be wrong or blocked by Telegram.")
 
-PERSISTENCE_FILE = "job_data.json"
+    run_in_background(work, done, status="Testing Telegram bot...")
 
-PERSISTENCE_FILE = "job_data.json"
 
 def save_jobs_to_file():
+    # Changes are journaled as they happen; saving just checkpoints them into the snapshot
     try:
-        def serialize_job(job):
-            # Convert time to string only if it's a datetime object
-            new_job = job.copy()
-            if isinstance(new_job.get("time"), datetime):
-                new_job["time"] = new_job["time"].strftime("%Y-%m-%d %H:%M:%S")
-            return new_job
-
-        data = {
-            "job_queue": [
-                {k: v for k, v in job.items() if k not in ("email", "password")}
-                for job in job_queue
-            ],
-            "manual_jobs": [
-                serialize_job({k: v for k, v in job.items() if k not in ("email", "password")})
-                for job in manual_jobs
-            ],
-            "scheduled_jobs": [
-                serialize_job({k: v for k, v in job.items() if k not in ("email", "password")})
-                for job in scheduled_jobs
-            ]
-        }
-
-        with open(PERSISTENCE_FILE, "w") as f:
-            json.dump(data, f, indent=2)
-
+        journal.compact(snapshot_jobs)
         mb.showinfo("Success", "Jobs successfully saved to file.")
         print("[SAVE] Jobs saved.")
 
     except Exception as e:
         mb.showerror("Error", f"Failed to save jobs: {e}")
+
+
+def compact_journal_periodically():
+    compact_journal_if_needed()
+    app.after(JOURNAL_CHECK_MS, compact_journal_periodically)
+
+
 def load_jobs_from_file():
-    if not os.path.exists(PERSISTENCE_FILE):
+    if not has_saved_jobs():
         mb.showwarning("Not Found", "No saved job file found.")
         return
 
     try:
-        with open(PERSISTENCE_FILE, "r") as f:
-            data = json.load(f)
-
-        # Clear existing jobs and UI
-        job_queue.clear()
-        queue_listbox.delete(0, tk.END)
-        manual_jobs.clear()
-        manual_listbox.delete(0, tk.END)
-        scheduled_jobs.clear()
-        scheduled_listbox.delete(0, tk.END)
-        scheduled_times.clear()
-        scheduled_queue_times.clear()
-
-        # Load job_queue
-        for job in data.get("job_queue", []):
-            job_queue.append(job)
-            queue_listbox.insert(
-                tk.END,
-                f"📝 Ticket: {job['ticket']} | Solve: {'Yes' if job['solve_ticket'] else 'No'} | "
-                f"Public: {'Yes' if job['public_reply'] else 'No'} | Check Last: {'Yes' if job['check_last'] else 'No'}"
-            )
-
-        # Load manual_jobs
-        for job in data.get("manual_jobs", []):
-            time_obj = datetime.strptime(job["time"], "%Y-%m-%d %H:%M:%S")
-            job["time"] = time_obj
-            job["job_id"] = f"{job['ticket']}_{time_obj.strftime('%Y%m%d%H%M')}"
-            manual_jobs.append(job)
-
-            if time_obj > datetime.now():
-                scheduled_times.append(time_obj)
-
-                scheduler.add_job(
-                    send_message_to_ticket,
-                    "date",
-                    run_date=time_obj,
-                    args=[
-                        email_entry.get().strip(),
-                        password_entry.get().strip(),
-                        job["ticket"],
-                        job["message"],
-                        job.get("last_comment", ""),  # ✅ Use saved last_comment
-                        job["check_last"],
-                        job["solve_ticket"],
-                        job["public_reply"],
-                    ],
-                    id=job["job_id"],
-                    replace_existing=True
-                )
-
-            manual_listbox.insert(
-                tk.END,
-                f"Manual: {job['ticket']} at {time_obj.strftime('%H:%M')} | "
-                f"Solve: {'Yes' if job['solve_ticket'] else 'No'} | "
-                f"Public: {'Yes' if job['public_reply'] else 'No'} | "
-                f"Check Last: {'Yes' if job['check_last'] else 'No'}"
-            )
-
-        # Load scheduled_jobs
-        for job in data.get("scheduled_jobs", []):
-            try:
-                time_obj = datetime.strptime(job["time"], "%Y-%m-%d %H:%M:%S")
-                job["time"] = time_obj
-                job["job_id"] = f"{job['ticket']}_{time_obj.strftime('%Y%m%d%H%M')}"
-                scheduled_jobs.append(job)
-
-                if time_obj > datetime.now():
-                    scheduled_times.append(time_obj)
-                    scheduled_queue_times.append(time_obj)
-
-                    scheduler.add_job(
-                        send_message_to_ticket,
-                        "date",
-                        run_date=time_obj,
-                        args=[
-                            email_entry.get().strip(),
-                            password_entry.get().strip(),
-                            job["ticket"],
-                            job["message"],
-                            job.get("last_comment", ""),  # ✅ Use saved last_comment
-                            job["check_last"],
-                            job["solve_ticket"],
-                            job["public_reply"],
-                        ],
-                        id=job["job_id"],
-                        replace_existing=True
-                    )
-
-                scheduled_listbox.insert(
-                    tk.END,
-                    f"📤 {time_obj.strftime('%H:%M')} → Ticket: {job['ticket']} | "
-                    f"Solve: {'Yes' if job['solve_ticket'] else 'No'} | "
-                    f"Public: {'Yes' if job['public_reply'] else 'No'} | "
-                    f"Check Last: {'Yes' if job['check_last'] else 'No'}"
-                )
-            except Exception as e:
-                print(f"[ERROR] Failed to load scheduled job for ticket {job.get('ticket', '???')}: {e}")
-
+        load_job_state()
+        render_job_lists()
         mb.showinfo("Loaded", "Jobs successfully loaded and scheduled.")
-        print("[LOAD] Job data restored.")
 
     except Exception as e:
         mb.showerror("Error", f"Failed to load jobs: {e}")
 
 
+# --- Background tasks ---
+background_tasks = 0
 
 
-def convert_formatting(text):
-    text = re.sub(r"\[([^\]]+)]\s*\((https?://[^\)]+)\)", r'<a href="\2">\1</a>', text)
-    text = re.sub(r"\*\*((?:.|\n)*?)\*\*", r"<b>\1</b>", text)
-    text = re.sub(r"_(.*?)_", r"<i>\1</i>", text)
-    return text
+def run_in_background(work, on_done=None, on_error=None, status="Working..."):
+    # Blocking network calls run on a worker thread; results come back through
+    # app.after, so callbacks may touch widgets
+    global background_tasks
+    background_tasks += 1
+    show_task_status(status)
 
-
-def format_message_with_html(text):
-    lines = text.splitlines()
-    html_lines = []
-    in_list = False
-    for line in lines:
-        stripped = line.strip()
-        if not stripped:
-            continue
-        formatted = convert_formatting(stripped)
-        if stripped.startswith(("-", "•")):
-            if not in_list:
-                html_lines.append("<ul>")
-                in_list = True
-            html_lines.append(f"<li>{formatted[1:].strip()}</li>")
+    def worker():
+        try:
+            result = work()
+        except Exception as e:
+            app.after(0, finish_background_task, on_error or show_task_error, e)
         else:
-            if in_list:
-                html_lines.append("</ul>")
-                in_list = False
-            html_lines.append(f"<p>{formatted}</p>")
-    if in_list:
-        html_lines.append("</ul>")
-    return "".join(html_lines)
-
-
-# --- Zendesk API Calls ---
-def get_last_comment(email, password, ticket_id):
-    url = f"https://inventry.zendesk.com/api/v2/tickets/{ticket_id}/comments.json"
-    try:
-        response = requests.get(url, auth=(email, password))
-        if response.status_code == 200:
-            comments = response.json().get("comments", [])
-            if comments:
-                last_comment = comments[-1]
-                return clean_html(
-                    last_comment.get("html_body") or last_comment.get("body")
-                )
-    except Exception as e:
-        print(f"[ERROR] Could not fetch last comment for ticket {ticket_id}: {e}")
-    return ""
-
-
-def send_message(email, password, ticket_id, message, solve_ticket, public_reply):
-    url = f"https://inventry.zendesk.com/api/v2/tickets/{ticket_id}.json"
-    headers = {
-        "Content-Type": "application/json",
-        "Accept": "application/json",
-        "X-Requested-With": "XMLHttpRequest",
-        "User-Agent": REAL_USER_AGENT,
-    }
-
-    # ✨ Default values
-    payload = {
-        "ticket": {
-            "comment": {
-                "html_body": message,
-                "public": public_reply,
-            },
-            "status": "solved" if solve_ticket else "open",
-            "priority": "normal",
-            "type": "incident",
-            "custom_fields": [
-                {"id": 360004384577, "value": "software"}  # Example field ID
-            ],
-        }
-    }
+            app.after(0, finish_background_task, on_done, result)
 
-    try:
-        response = requests.put(url, headers=headers, data=json.dumps(payload), auth=(email, password))
-        now_time = datetime.now().strftime("%H:%M:%S")
-
-        if response.status_code == 200:
-            log_text = f"✅ {now_time} → Ticket: {ticket_id} | Solved: {'Yes' if solve_ticket else 'No'}"
-            print(f"[SUCCESS] {log_text}")
-            sent_log.append(log_text)
-            sent_listbox.insert(tk.END, log_text)
-
-            # 🔔 Telegram update
-            bot_token = telegram_token_entry.get().strip()
-            chat_id = telegram_chatid_entry.get().strip()
-            if bot_token and chat_id:
-                status_text = "Solved ✅" if solve_ticket else "Open 🟡"
-                reply_type = "Public Email 📤" if public_reply else "Internal Note 🛡️"
-                telegram_msg = f"🎫 Ticket #{ticket_id} | {status_text} | {reply_type} | Sent at {now_time}"
-                send_telegram_message(bot_token, chat_id, telegram_msg)
-        else:
-            print(f"[ERROR] Failed to update ticket #{ticket_id}: {response.status_code}")
-            print(f"[DETAILS] {response.text}")
-
-            if response.status_code == 422:
-                print("[INFO] Retrying with plain text body...")
-                payload["ticket"]["comment"].pop("html_body")
-                payload["ticket"]["comment"]["body"] = message
-
-                retry_response = requests.put(url, headers=headers, data=json.dumps(payload), auth=(email, password))
-                if retry_response.status_code == 200:
-                    log_text = f"✅ {now_time} → Ticket: {ticket_id} | Solved: {'Yes' if solve_ticket else 'No'} (plain text)"
-                    print(f"[SUCCESS] {log_text}")
-                    sent_log.append(log_text)
-                    sent_listbox.insert(tk.END, log_text)
-                else:
-                    print(f"[RETRY ERROR] {retry_response.status_code}: {retry_response.text}")
+    threading.Thread(target=worker, daemon=True).start()
 
-    except Exception as e:
-        print(f"[EXCEPTION] Error while sending to ticket #{ticket_id}: {str(e)}")
-
-
-def send_message_to_ticket(
-    email,
-    password,
-    ticket_id,
-    message,
-    original_last_comment,
-    check_last,
-    solve_ticket,
-    public_reply,
-):
-    if check_last:
-        current_last_comment = get_last_comment(email, password, ticket_id)
 
-        # 🔍 Debug prints to help verify the comparison
-        print(f"[DEBUG] Saved last comment:\n{repr(original_last_comment.strip())}")
-        print(f"[DEBUG] Current last comment:\n{repr(current_last_comment.strip())}")
+def finish_background_task(callback, value):
+    global background_tasks
+    background_tasks -= 1
+    show_task_status()
+    if callback:
+        callback(value)
+
+
+def show_task_error(error):
+    mb.showerror("Error", f"Request failed: {error}")
 
-        # ✅ Compare cleaned & stripped comments
-        if clean_html(current_last_comment).strip() != clean_html(original_last_comment).strip():
-            print(
-                f"[SKIPPED] Ticket #{ticket_id} changed since scheduling. Not sending."
-            )
-            return
 
-    send_message(email, password, ticket_id, message, solve_ticket, public_reply)
+def show_task_status(status=None):
+    if background_tasks:
+        if status:
+            task_status_label.configure(text=status)
+        task_progress.pack(pady=(0, 5), after=task_status_label)
+        task_progress.start()
+    else:
+        task_status_label.configure(text="")
+        task_progress.stop()
+        task_progress.pack_forget()
+
+
+def prefetch_in_background(account, ticket_ids, on_done):
+    # on_done(fingerprints, failed)
+    run_in_background(
+        lambda: prefetch_fingerprints(account, ticket_ids),
+        lambda result: on_done(*result),
+        status=f"🔁 Fetching last comments for {len(ticket_ids)} ticket(s)...",
+    )
 
 
+def return_failed_tickets(failed, message):
+    # Tickets whose last comment couldn't be fetched go back into the form, so they can be retried
+    if not failed:
+        return
+    ticket_entry.insert(tk.END, (" " if ticket_entry.get().strip() else "") + " ".join(failed))
+    if not message_box.get("1.0", tk.END).strip():
+        message_box.insert("1.0", message)
+    mb.showwarning(
+        "Not Added",
+        f"Could not fetch the last comment for {len(failed)} ticket(s), so they were not added:\n"
+        + ", ".join(failed[:20]) + (" ..." if len(failed) > 20 else ""),
+    )
+
 
 # --- Scheduling Helpers ---
 
@@ -497,8 +310,15 @@ def preview_message_window(msg):
 
 
 # --- Last comment popup ---
-def check_last_comment_popup(email, password, ticket):
-    comment = get_last_comment(email, password, ticket)
+def check_last_comment_popup(account, ticket):
+    run_in_background(
+        lambda: get_last_comment(account, ticket),
+        lambda comment: show_last_comment(ticket, comment),
+        status=f"📩 Fetching last comment for ticket {ticket}...",
+    )
+
+
+def show_last_comment(ticket, comment):
     win = tk.Toplevel()
     win.title(f"Last Comment for Ticket {ticket}")
     text = tk.Text(win, wrap="word", font=("Arial", 11))
@@ -510,50 +330,68 @@ def check_last_comment_popup(email, password, ticket):
     text.config(yscrollcommand=scrollbar.set)
 
 
-# --- Delete selected jobs from listbox and data list ---
-def delete_selected(event, listbox, data_list):
-    sel = listbox.curselection()
-    if sel:
-        i = sel[0]
-
-        # Clean scheduler + tracking lists if applicable
-        if i < len(data_list):
-            job = data_list[i]
-
-            job_id = job.get("job_id")
-            if job_id:
-                try:
-                    scheduler.remove_job(job_id)
-                except:
-                    pass
-
-            if isinstance(job.get("time"), datetime):
-                if job["time"] in scheduled_times:
-                    scheduled_times.remove(job["time"])
-                if job["time"] in scheduled_queue_times:
-                    scheduled_queue_times.remove(job["time"])
-
-        listbox.delete(i)
-        del data_list[i]
-
-
-# --- Countdown updater ---
-def countdown_updater():
-    while True:
-        if scheduled_times:
-            now = datetime.now()
-            future = [t for t in scheduled_times if t > now]
-            if future:
-                next_job = min(future)
-                time_left = int((next_job - now).total_seconds())
-                mins, secs = divmod(time_left, 60)
-                countdown_label.configure(text=f"⏳ Next: {mins:02}:{secs:02}")
-            else:
-                countdown_label.configure(text="✅ All jobs done")
-                scheduled_times.clear()
-        else:
-            countdown_label.configure(text="⏳ No jobs scheduled")
-        time.sleep(1)
+# --- Delete selected job from its view and the registry ---
+def delete_selected(event, view):
+    # Clean scheduler + registry
+    job = view.selected_item()
+    if job is None:
+        return
+    if job.time is not None:
+        try:
+            scheduler.remove_job(job.job_id)
+        except:
+            pass
+    journal.record("delete", job_id=job.job_id)
+    registry.remove(job.job_id)
+    view.refresh()
+
+
+# --- Countdown ---
+WAKE_POLL_MS = 100  # How often the main thread picks up refreshes requested by worker threads
+
+countdown_after_id = None
+countdown_wake_pending = False
+
+
+def refresh_countdown():
+    # Ticks once a second only while something is pending; idle otherwise
+    global countdown_after_id
+    countdown_after_id = None
+    had_jobs = len(scheduled_times) > 0
+    now = datetime.now()
+    next_job = scheduled_times.next_after(now)
+    if next_job is None:
+        countdown_label.configure(text="✅ All jobs done" if had_jobs else "⏳ No jobs scheduled")
+        return
+
+    time_left = int((next_job - now).total_seconds())
+    mins, secs = divmod(time_left, 60)
+    countdown_label.configure(text=f"⏳ Next: {mins:02}:{secs:02}")
+    countdown_after_id = app.after(1000, refresh_countdown)
+
+
+def request_countdown_wake():
+    # May be called from worker threads, so it only sets a flag; a Tk call here would
+    # block until the main thread serviced it, and deadlock if that thread waits on us
+    global countdown_wake_pending
+    countdown_wake_pending = True
+
+
+def wake_countdown():
+    global countdown_wake_pending
+    countdown_wake_pending = False
+    if countdown_after_id is not None:
+        app.after_cancel(countdown_after_id)
+    refresh_countdown()
+
+
+def poll_wake_requests():
+    # Runs on the main thread and does the refreshes worker threads asked for
+    if countdown_wake_pending:
+        wake_countdown()
+    for view in list_views:
+        view.refresh_if_requested()
+    app.after(WAKE_POLL_MS, poll_wake_requests)
 
 
 # --- GUI Setup ---
@@ -567,6 +405,11 @@ scrollable_frame = CTkScrollableFrame(app, width=740, height=880)
 scrollable_frame.pack(padx=10, pady=10, fill="both", expand=True)
 frame = scrollable_frame
 
+CTkLabel(frame, text="Zendesk Account (more brands in zendesk_accounts.json):").pack(pady=(5, 0))
+account_option = CTkOptionMenu(frame, values=load_accounts_file(), command=select_account)
+account_option.set(DEFAULT_ACCOUNT)
+account_option.pack(pady=3)
+
 CTkLabel(frame, text="Zendesk Email:").pack(pady=(5, 0))
 email_entry = CTkEntry(frame, width=700)
 email_entry.pack(pady=3)
@@ -575,11 +418,11 @@ CTkLabel(frame, text="Zendesk Password:").pack(pady=(5, 0))
 password_entry = CTkEntry(frame, width=700, show="*")
 password_entry.pack(pady=3)
 
-CTkLabel(frame, text="Ticket ID:").pack(pady=(5, 0))
+CTkLabel(frame, text="Ticket ID(s) (separate several with spaces or commas):").pack(pady=(5, 0))
 ticket_entry = CTkEntry(frame, width=700)
 ticket_entry.pack(pady=3)
 
-CTkLabel(frame, text="Message to Send:").pack(pady=(5, 0))
+CTkLabel(frame, text="Message to Send ({{requester_name}} and {{ticket_id}} are filled in per ticket):").pack(pady=(5, 0))
 message_box = CTkTextbox(frame, width=700, height=130)
 message_box.pack(pady=3)
 
@@ -736,43 +579,47 @@ button_frame.pack(pady=5)
 
 
 def add_to_queue():
-    email = email_entry.get().strip()
-    password = password_entry.get().strip()
-    ticket = ticket_entry.get().strip()
+    account = selected_account()
+    tickets = parse_ticket_ids(ticket_entry.get())
     message = message_box.get("1.0", tk.END).strip()
     check_last = check_last_var.get()
     solve_ticket = solve_ticket_var.get()
     public_reply = public_reply_var.get()
 
-    if not (email and password and ticket and message):
+    if not (account.ready() and tickets and message):
         mb.showwarning("Missing Info", "Please fill all fields before adding to queue.")
         return
 
-    html_message = format_message_with_html(message)
-    last_comment = get_last_comment(email, password, ticket) if check_last else ""
-
-    job_queue.append(
-        {
-            "email": email,
-            "password": password,
-            "ticket": ticket,
-            "message": html_message,
-            "raw_message": message,  # ✅ preserve formatting
-            "last_comment": last_comment,
-            "check_last": check_last,
-            "solve_ticket": solve_ticket,
-            "public_reply": public_reply,
-        }
-    )
+    template_id = templates.add(message)  # ✅ formatted once, shared by every ticket
+
+    def enqueue(fingerprints, failed=()):
+        for ticket in tickets:
+            if ticket in failed:
+                continue
+            job = JobRecord(
+                job_id=new_job_id(ticket),
+                ticket=ticket,
+                template_id=template_id,
+                last_comment_fp=fingerprints.get(ticket, ""),
+                check_last=check_last,
+                solve_ticket=solve_ticket,
+                public_reply=public_reply,
+                account=account.name,
+            )
+            registry.add(job)
+            journal.record("add", "job_queue", job)
 
-    queue_listbox.insert(
-        tk.END,
-        f"📝 Ticket: {ticket} | Solve: {'Yes' if solve_ticket else 'No'} | Public: {'Yes' if public_reply else 'No'} | Check Last: {'Yes' if check_last else 'No'}",
-    )
+        queue_view.refresh()
+        return_failed_tickets(failed, message)
 
     ticket_entry.delete(0, tk.END)
     message_box.delete("1.0", tk.END)
 
+    if check_last:
+        prefetch_in_background(account, tickets, enqueue)
+    else:
+        enqueue({})
+
 
 def preview_message():
     msg = message_box.get("1.0", tk.END).strip()
@@ -783,25 +630,27 @@ def preview_message():
 
 
 def check_last_email():
-    email = email_entry.get().strip()
-    password = password_entry.get().strip()
+    account = selected_account()
     ticket = ticket_entry.get().strip()
-    if not (email and password and ticket):
+    if not (account.ready() and ticket):
         mb.showerror(
             "Missing Info",
             "Please fill Zendesk Email, Password and Ticket ID to check last email.",
         )
         return
-    check_last_comment_popup(email, password, ticket)
+    check_last_comment_popup(account, ticket)
 
 
 def clear_queue():
-    job_queue.clear()
-    queue_listbox.delete(0, tk.END)
+    registry.clear("queue")
+    journal.record("clear", "job_queue")
+    queue_view.refresh()
 
 
-def edit_job_popup(index, job_list, listbox, is_manual=False):
-    job = job_list[index]
+def edit_job_popup(state, view):
+    job = view.selected_item()
+    if job is None:
+        return
 
     popup = CTkToplevel()
     popup.title("✏️ Edit Job")
@@ -815,7 +664,7 @@ def edit_job_popup(index, job_list, listbox, is_manual=False):
 
     CTkLabel(popup, text="🎫 Ticket ID:").pack(pady=(10, 0))
     ticket_entry = CTkEntry(popup, width=400)
-    ticket_entry.insert(0, job.get("ticket", ""))
+    ticket_entry.insert(0, job.ticket)
     ticket_entry.pack(pady=5)
 
     CTkLabel(popup, text="📝 Message:").pack(pady=(10, 0))
@@ -826,38 +675,31 @@ def edit_job_popup(index, job_list, listbox, is_manual=False):
 
 
 
-    # ✅ Use raw_message if available, else fallback to cleaned HTML
-    raw_msg = job.get("raw_message")
-    if raw_msg:
-        message_box.insert("1.0", raw_msg)
-    else:
-        message_box.insert("1.0", clean_html(job.get("message", "")))
+    message_box.insert("1.0", job.raw_message)
 
     message_box.pack(pady=5)
 
     from tkinter import ttk
     ttk.Separator(popup).pack(fill="x", pady=10)
 
-    solve_var = tk.BooleanVar(value=job.get("solve_ticket", False))
+    solve_var = tk.BooleanVar(value=job.solve_ticket)
     CTkSwitch(popup, text="✅ Mark as Solved", variable=solve_var).pack(pady=5)
 
-    public_var = tk.BooleanVar(value=job.get("public_reply", False))
+    public_var = tk.BooleanVar(value=job.public_reply)
     CTkSwitch(popup, text="📤 Public Reply", variable=public_var).pack(pady=5)
 
-    check_last_var_popup = tk.BooleanVar(value=job.get("check_last", False))
+    check_last_var_popup = tk.BooleanVar(value=job.check_last)
     CTkCheckBox(popup, text="🔁 Check Last Comment", variable=check_last_var_popup).pack(pady=5)
 
     popup.after(100, lambda: ticket_entry.focus_set())
 
     # Time picker (only for scheduled/manual jobs)
-    if "time" in job:
+    if job.time is not None:
         CTkLabel(popup, text="⏰ Edit Scheduled Time:").pack(pady=(10, 0))
         time_frame = CTkFrame(popup)
         time_frame.pack(pady=5)
 
-        time_obj = job["time"]
-        if isinstance(time_obj, str):
-            time_obj = datetime.strptime(time_obj, "%Y-%m-%d %H:%M:%S")
+        time_obj = job.time
 
         hour_var = tk.StringVar(value=f"{time_obj.hour:02d}")
         minute_var = tk.StringVar(value=f"{time_obj.minute:02d}")
@@ -875,19 +717,18 @@ def edit_job_popup(index, job_list, listbox, is_manual=False):
     ttk.Separator(popup).pack(fill="x", pady=10)
 
     def save_changes():
-        job["ticket"] = ticket_entry.get().strip()
-
-        # ✅ Save raw_message and update formatted HTML version
+        # ✅ Unchanged text maps back to the same template
         raw_message = message_box.get("1.0", tk.END).strip()
-        job["raw_message"] = raw_message
-        job["message"] = format_message_with_html(raw_message)
-
-        job["solve_ticket"] = solve_var.get()
-        job["public_reply"] = public_var.get()
-        job["check_last"] = check_last_var_popup.get()
+        changes = {
+            "ticket": ticket_entry.get().strip(),
+            "template_id": templates.add(raw_message),
+            "solve_ticket": solve_var.get(),
+            "public_reply": public_var.get(),
+            "check_last": check_last_var_popup.get(),
+        }
 
         try:
-            if "time" in job:
+            if job.time is not None:
                 new_hour = int(hour_var.get())
                 new_minute = int(minute_var.get())
 
@@ -897,65 +738,25 @@ def edit_job_popup(index, job_list, listbox, is_manual=False):
                 new_time = datetime.now().replace(hour=new_hour, minute=new_minute, second=0, microsecond=0)
                 if new_time < datetime.now():
                     new_time += timedelta(days=1)
-
-                old_time = job.get("time")
-                old_job_id = job.get("job_id")
-
-                job["time"] = new_time
-                job_id = f"{job['ticket']}_{new_time.strftime('%Y%m%d%H%M')}"
-                job["job_id"] = job_id
-
-                if old_job_id:
-                    try:
-                        scheduler.remove_job(old_job_id)
-                    except Exception as e:
-                        print(f"[WARN] Could not remove old job: {old_job_id} → {e}")
-
-                if isinstance(old_time, datetime) and old_time in scheduled_queue_times:
-                    scheduled_queue_times.remove(old_time)
-                scheduled_queue_times.append(new_time)
-
-                if isinstance(old_time, datetime) and old_time in scheduled_times:
-                    scheduled_times.remove(old_time)
-                scheduled_times.append(new_time)
-
-                scheduler.add_job(
-                    send_message_to_ticket,
-                    "date",
-                    run_date=new_time,
-                    args=[
-                        email_entry.get().strip(),
-                        password_entry.get().strip(),
-                        job["ticket"],
-                        job["message"],
-                        job.get("last_comment", ""),
-                        job["check_last"],
-                        job["solve_ticket"],
-                        job["public_reply"],
-                    ],
-                    id=job_id,
-                    replace_existing=True
-                )
-
-                # ✅ Replace updated job in list
-                target_list = manual_jobs if is_manual else scheduled_jobs
-                for i, j in enumerate(target_list):
-                    if j == job:
-                        target_list[i] = job
-                        break
+                changes["time"] = new_time
 
         except ValueError:
             mb.showerror("Invalid Time", "Please enter valid hour (0–23) and minute (0–59).")
             return
 
-        # ✅ Refresh listbox label
-        if "time" in job:
-            display = f"{'Manual:' if is_manual else '📤'} {job['ticket']} at {job['time'].strftime('%H:%M')} | Solve: {'Yes' if job['solve_ticket'] else 'No'} | Public: {'Yes' if job['public_reply'] else 'No'} | Check Last: {'Yes' if job['check_last'] else 'No'}"
-        else:
-            display = f"📝 Ticket: {job['ticket']} | Solve: {'Yes' if job['solve_ticket'] else 'No'} | Public: {'Yes' if job['public_reply'] else 'No'} | Check Last: {'Yes' if job['check_last'] else 'No'}"
+        if job.job_id not in registry:
+            mb.showerror("Job Gone", "This job was deleted while you were editing it.")
+            popup.destroy()
+            return
 
-        listbox.delete(index)
-        listbox.insert(index, display)
+        # Same job_id, so the scheduler replaces the old run in place
+        registry.update(job.job_id, **changes)
+        if job.time is not None:
+            schedule_send(job)
+        journal.record("edit", JOB_STATES[state], job)
+
+        # ✅ Refresh list row
+        view.refresh()
         popup.destroy()
 
     popup.bind("<Return>", lambda e: save_changes())
@@ -985,6 +786,74 @@ CTkButton(button_frame, text="📩 Check Last Email", command=check_last_email).
     side=tk.LEFT, padx=5
 )
 
+# Background task progress (shown only while network calls are in flight)
+task_status_label = CTkLabel(frame, text="")
+task_status_label.pack()
+task_progress = CTkProgressBar(frame, mode="indeterminate", width=300)
+
+
+def import_in_background(load_tickets, source):
+    # load_tickets(account) returns an iterator of (ticket_id, variables)
+    account = selected_account()
+    message = message_box.get("1.0", tk.END).strip()
+    if not (account.ready() and message):
+        mb.showwarning("Missing Info", "Please fill email, password and the message before importing.")
+        return
+
+    template_id = templates.add(message)
+    check_last = check_last_var.get()
+    solve_ticket = solve_ticket_var.get()
+    public_reply = public_reply_var.get()
+
+    def progress(count, skipped, failed):
+        app.after(
+            0,
+            lambda: task_status_label.configure(text=f"📥 {source}: {count} queued, {skipped} skipped, {failed} failed..."),
+        )
+
+    def work():
+        return import_tickets(
+            account, load_tickets(account), template_id,
+            check_last, solve_ticket, public_reply, on_progress=progress,
+        )
+
+    def done(result):
+        jobs, failed = result
+        render_job_lists()  # Rows were added from the worker; redraw in registry order
+        text = f"Queued {len(jobs)} tickets from {source}."
+        if failed:
+            text += f"\n\n{len(failed)} ticket(s) were left out because their last comment couldn't be fetched:\n"
+            text += ", ".join(failed[:20]) + (" ..." if len(failed) > 20 else "")
+        mb.showinfo("Import Done", text)
+
+    run_in_background(work, done, status=f"📥 Importing tickets from {source}...")
+
+
+def import_csv():
+    path = filedialog.askopenfilename(filetypes=[("CSV files", "*.csv"), ("All files", "*.*")])
+    if path:
+        import_in_background(lambda account: read_ticket_csv(path), os.path.basename(path))
+
+
+def import_view_or_search():
+    source = import_entry.get().strip()
+    if not source:
+        mb.showwarning("Missing Info", "Enter a view ID or a search query to import from.")
+        return
+    if source.isdigit():
+        import_in_background(lambda account: view_ticket_ids(account, source), f"view {source}")
+    else:
+        import_in_background(lambda account: search_ticket_ids(account, source), "search")
+
+
+# Bulk import into the queue, using the message and toggles above
+import_frame = CTkFrame(frame)
+import_frame.pack(pady=5)
+import_entry = CTkEntry(import_frame, width=380, placeholder_text="View ID or search query (e.g. status:open tags:refund)")
+import_entry.pack(side=tk.LEFT, padx=5)
+CTkButton(import_frame, text="📥 Import View/Search", command=import_view_or_search).pack(side=tk.LEFT, padx=5)
+CTkButton(import_frame, text="📄 Import CSV", command=import_csv).pack(side=tk.LEFT, padx=5)
+
 # Interval selection
 CTkLabel(frame, text="⏱ Select Time Between Emails:").pack(pady=(10, 0))
 interval_option = CTkOptionMenu(
@@ -993,6 +862,45 @@ interval_option = CTkOptionMenu(
 interval_option.set("15 min between emails")
 interval_option.pack(pady=5)
 
+# How many queued jobs may share one interval slot
+slot_capacity_option = CTkOptionMenu(
+    frame, values=[f"{n} per slot" for n in (1, 2, 3, 5, 10, 20)]
+)
+slot_capacity_option.set(f"{SLOT_CAPACITY} per slot")
+slot_capacity_option.pack(pady=5)
+
+# Spread a slot's sends over part of the interval instead of firing them together
+slot_jitter_var = tk.BooleanVar(value=False)
+CTkSwitch(
+    frame,
+    text="Spread Sends Within Each Slot (jitter)",
+    variable=slot_jitter_var,
+    onvalue=True,
+    offvalue=False,
+).pack(pady=5)
+
+# Group jobs that come due together into update_many calls
+bulk_send_var = tk.BooleanVar(value=False)
+CTkSwitch(
+    frame,
+    text="Batch Jobs Due Together (update_many)",
+    variable=bulk_send_var,
+    onvalue=True,
+    offvalue=False,
+    command=lambda: setattr(bulk_dispatcher, "enabled", bulk_send_var.get()),
+).pack(pady=5)
+
+# Run sends as coroutines instead of blocking scheduler threads
+async_send_var = tk.BooleanVar(value=False)
+CTkSwitch(
+    frame,
+    text=f"Async Send Engine (up to {ASYNC_SEND_CONCURRENCY} in flight)",
+    variable=async_send_var,
+    onvalue=True,
+    offvalue=False,
+    command=lambda: setattr(async_engine, "enabled", async_send_var.get()),
+).pack(pady=5)
+
 # Schedule and clear buttons frame 2
 buttons_frame_2 = CTkFrame(frame)
 buttons_frame_2.pack(pady=5)
@@ -1009,35 +917,41 @@ file_button_frame.pack(pady=(10, 5))
 CTkButton(file_button_frame, text="💾 Save Jobs to File", command=save_jobs_to_file).pack(side=tk.LEFT, padx=10)
 CTkButton(file_button_frame, text="📂 Load Jobs from File", command=load_jobs_from_file).pack(side=tk.LEFT, padx=10)
 
-# Queued Jobs Listbox
+# 🔍 Search across every list (debounced, so typing stays smooth with big lists)
+CTkLabel(frame, text="🔍 Search Jobs and Logs:").pack(pady=(10, 0))
+search_entry = CTkEntry(frame, width=700, placeholder_text="Ticket ID, time, Solve: Yes, ...")
+search_entry.pack(pady=3)
+search_after_id = None
+
+
+def schedule_search(event=None):
+    global search_after_id
+    if search_after_id is not None:
+        app.after_cancel(search_after_id)
+    search_after_id = app.after(200, apply_search)
+
+
+def apply_search():
+    global search_after_id
+    search_after_id = None
+    for view in list_views:
+        view.set_query(search_entry.get())
+
+
+search_entry.bind("<KeyRelease>", schedule_search)
+
+# Queued Jobs List
 CTkLabel(frame, text="📋 Queued Jobs:").pack(pady=(10, 0))
-queue_frame = tk.Frame(frame)
-queue_frame.pack()
-queue_scrollbar = tk.Scrollbar(queue_frame)
-queue_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-queue_listbox = tk.Listbox(
-    queue_frame, width=90, height=6, yscrollcommand=queue_scrollbar.set
-)
-queue_listbox.pack(side=tk.LEFT, fill=tk.BOTH)
-queue_scrollbar.config(command=queue_listbox.yview)
-queue_listbox.bind("<Delete>", lambda e: delete_selected(e, queue_listbox, job_queue))
-queue_listbox.bind("<Delete>", lambda e: delete_selected(e, queue_listbox, job_queue))
+queue_view = VirtualList(frame, lambda: registry.jobs("queue"), lambda job: job_row(job, "queue"), height=6)
+queue_view.pack()
+queue_view.listbox.bind("<Delete>", lambda e: delete_selected(e, queue_view))
 
 
-# Scheduled Jobs Listbox
+# Scheduled Jobs List
 CTkLabel(frame, text="📆 Scheduled Jobs:").pack(pady=(10, 0))
-scheduled_frame = tk.Frame(frame)
-scheduled_frame.pack()
-scheduled_scrollbar = tk.Scrollbar(scheduled_frame)
-scheduled_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-scheduled_listbox = tk.Listbox(
-    scheduled_frame, width=90, height=10, yscrollcommand=scheduled_scrollbar.set
-)
-scheduled_listbox.pack(side=tk.LEFT, fill=tk.BOTH)
-scheduled_scrollbar.config(command=scheduled_listbox.yview)
-scheduled_listbox.bind(
-    "<Delete>", lambda e: delete_selected(e, scheduled_listbox, scheduled_jobs)
-)
+scheduled_view = VirtualList(frame, lambda: registry.jobs("scheduled"), lambda job: job_row(job, "scheduled"), height=10)
+scheduled_view.pack()
+scheduled_view.listbox.bind("<Delete>", lambda e: delete_selected(e, scheduled_view))
 
 # Manual Job Scheduler
 manual_frame = CTkFrame(frame)
@@ -1060,19 +974,18 @@ minute_menu = CTkOptionMenu(
 minute_menu.pack(side=tk.LEFT, padx=(0, 15))
 
 def add_manual_job():
-    email = email_entry.get().strip()
-    password = password_entry.get().strip()
-    ticket = ticket_entry.get().strip()
+    account = selected_account()
+    tickets = parse_ticket_ids(ticket_entry.get())
     message = message_box.get("1.0", tk.END).strip()
     check_last = check_last_var.get()
     solve_ticket = solve_ticket_var.get()
     public_reply = public_reply_var.get()
 
-    if not (email and password and ticket and message):
+    if not (account.ready() and tickets and message):
         mb.showwarning("Missing Info", "Please fill all fields before adding manual job.")
         return
 
-    html_message = format_message_with_html(message)
+    template_id = templates.add(message)  # ✅ formatted once, shared by every ticket
 
     hour = int(hour_var.get())
     minute = int(minute_var.get())
@@ -1081,150 +994,174 @@ def add_manual_job():
     if run_time <= now:
         run_time += timedelta(days=1)
 
-    last_comment = get_last_comment(email, password, ticket) if check_last else ""
-    job_id = f"{ticket}_{run_time.strftime('%Y%m%d%H%M')}"
-
-    job = {
-        "email": email,
-        "password": password,
-        "ticket": ticket,
-        "message": html_message,
-        "raw_message": message,  # ✅ preserve original
-        "last_comment": last_comment,
-        "check_last": check_last,
-        "solve_ticket": solve_ticket,
-        "public_reply": public_reply,
-        "time": run_time,
-        "job_id": job_id,
-    }
-
-    manual_jobs.append(job)
-    scheduled_times.append(run_time)
-
-    scheduler.add_job(
-        lambda job=job: send_message_to_ticket(
-            email_entry.get().strip(),
-            password_entry.get().strip(),
-            job["ticket"],
-            job["message"],
-            job.get("last_comment", ""),
-            job["check_last"],
-            job["solve_ticket"],
-            job["public_reply"],
-        ),
-        "date",
-        run_date=run_time,
-        id=job_id,
-        replace_existing=True,
-    )
+    def schedule(fingerprints, failed=()):
+        for ticket in tickets:
+            if ticket in failed:
+                continue
+            job = JobRecord(
+                job_id=new_job_id(ticket),
+                ticket=ticket,
+                template_id=template_id,
+                last_comment_fp=fingerprints.get(ticket, ""),
+                check_last=check_last,
+                solve_ticket=solve_ticket,
+                public_reply=public_reply,
+                time=run_time,
+                state="manual",
+                account=account.name,
+            )
+            registry.add(job)
 
-    manual_listbox.insert(
-        tk.END,
-        f"Manual: {ticket} at {run_time.strftime('%H:%M')} | "
-        f"Solve: {'Yes' if solve_ticket else 'No'} | "
-        f"Public: {'Yes' if public_reply else 'No'} | "
-        f"Check Last: {'Yes' if check_last else 'No'}"
-    )
+            schedule_send(job)
+            journal.record("add", "manual_jobs", job)
+
+        manual_view.refresh()
+        return_failed_tickets(failed, message)
 
     ticket_entry.delete(0, tk.END)
     message_box.delete("1.0", tk.END)
 
+    if check_last:
+        prefetch_in_background(account, tickets, schedule)
+    else:
+        schedule({})
 
 
-def reschedule_manual_job(job, index, listbox):
-    try:
-        new_time = job["time"]
-        if isinstance(new_time, str):
-            new_time = datetime.strptime(new_time, "%Y-%m-%d %H:%M:%S")
-
-        job_id = f"{job['ticket']}_{new_time.strftime('%Y%m%d%H%M')}"
-        job["job_id"] = job_id
-
-        # Remove previous job with same ID if exists
-        for j in scheduler.get_jobs():
-            if j.id == job_id:
-                scheduler.remove_job(j.id)
-
-        # Clean up old times
-        for t in scheduled_times[:]:
-            if abs((t - new_time).total_seconds()) < 60:
-                scheduled_times.remove(t)
-        scheduled_times.append(new_time)
-
-        scheduler.add_job(
-            lambda job=job: send_message_to_ticket(
-                email_entry.get().strip(),
-                password_entry.get().strip(),
-                job["ticket"],
-                job["message"],
-                job.get("last_comment", ""),
-                job["check_last"],
-                job["solve_ticket"],
-                job["public_reply"],
-            ),
-            "date",
-            run_date=new_time,
-            id=job_id,
-            replace_existing=True,
-        )
 
-        # Update listbox
-        listbox.delete(index)
-        listbox.insert(
-            index,
-            f"Manual: {job['ticket']} at {new_time.strftime('%H:%M')} | "
-            f"Solve: {'Yes' if job['solve_ticket'] else 'No'} | "
-            f"Public: {'Yes' if job['public_reply'] else 'No'} | "
-            f"Check Last: {'Yes' if job['check_last'] else 'No'}"
+CTkButton(manual_frame, text="➕ Add Manual Job", command=add_manual_job).pack(pady=5)
+
+# Manual jobs list
+manual_view = VirtualList(frame, lambda: registry.jobs("manual"), lambda job: job_row(job, "manual"), height=6)
+manual_view.pack(pady=5)
+manual_view.listbox.bind("<Delete>", lambda e: delete_selected(e, manual_view))
+
+# Enable double-click editing for each job type
+queue_view.listbox.bind("<Double-Button-1>", lambda e: edit_job_popup("queue", queue_view))
+
+manual_view.listbox.bind("<Double-Button-1>", lambda e: edit_job_popup("manual", manual_view))
+
+scheduled_view.listbox.bind("<Double-Button-1>", lambda e: edit_job_popup("scheduled", scheduled_view))
+
+job_views = [queue_view, scheduled_view, manual_view]
+
+# Sent Log
+CTkLabel(frame, text="📨 Sent Log:").pack(pady=(10, 0))
+sent_view = VirtualList(frame, lambda: list(sent_log), lambda log_text: log_text, height=8)
+sent_view.pack()
+
+
+def sent_history_popup():
+    # Searches the on-disk archive; the list above only keeps the recent sends
+    popup = CTkToplevel()
+    popup.title("🗂 Sent History")
+    popup.attributes("-topmost", True)
+
+    fields = CTkFrame(popup)
+    fields.pack(pady=10)
+    CTkLabel(fields, text="Ticket ID:").pack(side=tk.LEFT, padx=(5, 2))
+    ticket_field = CTkEntry(fields, width=110)
+    ticket_field.pack(side=tk.LEFT, padx=(0, 10))
+    CTkLabel(fields, text="From:").pack(side=tk.LEFT, padx=(5, 2))
+    start_field = CTkEntry(fields, width=110, placeholder_text="YYYY-MM-DD")
+    start_field.pack(side=tk.LEFT, padx=(0, 10))
+    CTkLabel(fields, text="To:").pack(side=tk.LEFT, padx=(5, 2))
+    end_field = CTkEntry(fields, width=110, placeholder_text="YYYY-MM-DD")
+    end_field.pack(side=tk.LEFT, padx=(0, 10))
+    account_field = CTkOptionMenu(fields, values=["All accounts"] + accounts.names(), width=130)
+    account_field.pack(side=tk.LEFT, padx=(0, 10))
+
+    found = []
+    results = VirtualList(popup, lambda: found, lambda entry: f"{entry['at'][:10]} {entry['text']}", height=15)
+    results.pack(padx=10, pady=5)
+    summary = CTkLabel(popup, text="")
+    summary.pack(pady=(0, 10))
+
+    def search():
+        try:
+            start = datetime.strptime(start_field.get().strip(), "%Y-%m-%d").date() if start_field.get().strip() else None
+            end = datetime.strptime(end_field.get().strip(), "%Y-%m-%d").date() if end_field.get().strip() else None
+        except ValueError:
+            mb.showerror("Invalid Date", "Please enter dates as YYYY-MM-DD.", parent=popup)
+            return
+
+        def done(entries):
+            found[:] = entries
+            results.refresh()
+            summary.configure(text=f"{len(entries)} send(s) found")
+
+        ticket = ticket_field.get().strip()
+        account = None if account_field.get() == "All accounts" else account_field.get()
+        run_in_background(
+            lambda: sent_archive.search(ticket, start, end, account=account),
+            done,
+            status="🗂 Searching sent history...",
         )
 
-    except Exception as e:
-        mb.showerror("Reschedule Failed", f"Could not reschedule job.\n{e}")
+    CTkButton(fields, text="🔍 Search", command=search).pack(side=tk.LEFT, padx=5)
+    popup.bind("<Return>", lambda e: search())
 
 
+CTkButton(frame, text="🗂 Search Sent History", command=sent_history_popup).pack(pady=5)
 
-CTkButton(manual_frame, text="➕ Add Manual Job", command=add_manual_job).pack(pady=5)
+# Dead letters: sends that failed every retry (double-click retries, Delete dismisses)
+CTkLabel(frame, text="☠️ Failed Sends (double-click to retry, Delete to dismiss):").pack(pady=(10, 0))
 
-# Manual jobs listbox
-manual_list_frame = tk.Frame(frame)
-manual_list_frame.pack(pady=5)
-manual_scrollbar = tk.Scrollbar(manual_list_frame)
-manual_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-manual_listbox = tk.Listbox(
-    manual_list_frame, width=90, height=6, yscrollcommand=manual_scrollbar.set
-)
-manual_listbox.pack(side=tk.LEFT, fill=tk.BOTH)
-manual_scrollbar.config(command=manual_listbox.yview)
-manual_listbox.bind(
-    "<Delete>", lambda e: delete_selected(e, manual_listbox, manual_jobs)
-)
 
-# Enable double-click editing for each job type
-queue_listbox.bind("<Double-Button-1>", lambda e: edit_job_popup(queue_listbox.curselection()[0], job_queue, queue_listbox))
+def dead_letter_row(entry):
+    return f"☠️ {entry['at']} → Ticket: {ticket_label(entry['ticket'], entry.get('account', DEFAULT_ACCOUNT))} | {entry['attempt']} attempt(s) | {entry['error']}"
 
-manual_listbox.bind("<Double-Button-1>", lambda e: edit_job_popup(manual_listbox.curselection()[0], manual_jobs, manual_listbox, is_manual=True))
 
-scheduled_listbox.bind("<Double-Button-1>", lambda e: edit_job_popup(scheduled_listbox.curselection()[0], scheduled_jobs, scheduled_listbox, is_manual=False))
+dead_view = VirtualList(frame, retry_queue.dead_letters, dead_letter_row, height=5)
+dead_view.pack()
 
-# Sent Log
-CTkLabel(frame, text="📨 Sent Log:").pack(pady=(10, 0))
-sent_frame = tk.Frame(frame)
-sent_frame.pack()
-sent_scrollbar = tk.Scrollbar(sent_frame)
-sent_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-sent_listbox = tk.Listbox(
-    sent_frame, width=90, height=8, yscrollcommand=sent_scrollbar.set
-)
-sent_listbox.pack(side=tk.LEFT, fill=tk.BOTH)
-sent_scrollbar.config(command=sent_listbox.yview)
+
+def retry_dead_letter(event=None):
+    entry = dead_view.selected_item()
+    if entry:
+        retry_queue.requeue(entry["id"])
+
+
+def dismiss_dead_letter(event=None):
+    entry = dead_view.selected_item()
+    if entry:
+        retry_queue.dismiss(entry["id"])
+
+
+dead_view.listbox.bind("<Double-Button-1>", retry_dead_letter)
+dead_view.listbox.bind("<Delete>", dismiss_dead_letter)
+retry_queue.listeners.append(dead_view.request_refresh)
+list_views = job_views + [sent_view, dead_view]
 
 # Countdown Timer
 countdown_label = CTkLabel(frame, text="⏳ No jobs scheduled", font=("Arial", 14))
 countdown_label.pack(pady=15)
 
-# Start countdown + scheduler
-threading.Thread(target=countdown_updater, daemon=True).start()
-scheduler.start()
+# Zendesk API budget
+budget_label = CTkLabel(frame, text="📶 API budget: —")
+budget_label.pack(pady=(0, 10))
+
+
+def refresh_budget_label():
+    usage = accounts.governor(account_option.get()).usage()
+    text = f"📶 {account_option.get()} API budget: {usage['used']}/{usage['limit']} per min used"
+    if usage["waiting"]:
+        text += f" | {usage['waiting']} queued"
+    if usage["paused_for"]:
+        text += f" | paused {usage['paused_for']:.0f}s (429)"
+    budget_label.configure(text=text)
+    app.after(2000, refresh_budget_label)
+
+
+refresh_budget_label()
+
+# Start countdown + scheduler; the countdown refreshes whenever run times change
+scheduled_times.listeners.append(request_countdown_wake)
+app.after(WAKE_POLL_MS, poll_wake_requests)
+start_scheduler()
+start_metrics_server()
+restore_job_state()
+render_job_lists()
+app.after(JOURNAL_CHECK_MS, compact_journal_periodically)
 
 # 🤖 Telegram Setup Fields
 CTkLabel(frame, text="🤖 Telegram Bot Token:").pack(pady=(10, 0))
@@ -1241,4 +1178,11 @@ telegram_chatid_entry.pack(pady=3)
 
 load_telegram_settings()
 
+sent_listeners.append(lambda log_text: sent_view.request_refresh())
+for entry in (email_entry, password_entry, telegram_token_entry, telegram_chatid_entry):
+    entry.bind("<KeyRelease>", sync_settings)
+    entry.bind("<FocusOut>", sync_settings)
+select_account(account_option.get())
+sync_settings()
+
 app.mainloop()
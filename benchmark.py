@@ -0,0 +1,402 @@
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BENCH_EMAIL = "bench@example.com"
+BENCH_PASSWORD = "bench"
+BENCH_TELEGRAM_TOKEN = "bench"
+COMMENT_CREATED_AT = "2024-01-01T00:00:00Z"
+
+TICKET_RE = re.compile(r"^/api/v2/tickets/(\d+)\.json$")
+COMMENTS_RE = re.compile(r"^/api/v2/tickets/(\d+)/comments\.json$")
+
+SAMPLE_MESSAGE = """Hi {{requester_name}},
+
+Thanks for reaching out about ticket {{ticket_id}}. Here is what we found:
+- **Step one**: open [the dashboard](https://example.com/dashboard)
+- **Step two**: clear the _cached_ settings
+• Restart the app
+
+If this doesn't help, just reply to this email. **Variant %d**
+"""
+
+# Markup fragments the formatter check strings random texts from
+FORMAT_PIECES = ["[", "]", "(", ")", "**", "*", "_", "\n", " ", "\t", "a", "b", "http://", "https://", "x.io", "](", "/"]
+
+
+# --- Fake Zendesk / Telegram API ---
+class FakeApiHandler(BaseHTTPRequestHandler):
+    # Answers the handful of Zendesk and Telegram endpoints the engine calls, with
+    # the latency, 429s and 422s asked for on the command line
+    protocol_version = "HTTP/1.1"  # Keep-alive, like the real APIs
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_PUT(self):
+        self._handle("PUT")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def _handle(self, method):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        config = self.server.config
+        time.sleep((config.latency_ms + random.uniform(0, config.jitter_ms)) / 1000)
+
+        path = self.path.split("?")[0]
+        if path.startswith("/bot"):
+            self._reply("telegram", 200, {"ok": True, "result": {"message_id": 1}})
+            return
+        if random.random() < config.rate_429:
+            self._reply("rate_limited", 429, {"error": "APIRateLimitExceeded"}, {"Retry-After": str(config.retry_after)})
+            return
+
+        match = COMMENTS_RE.match(path)
+        if match and method == "GET":
+            ticket_id = int(match.group(1))
+            comment = {"id": ticket_id * 10, "created_at": COMMENT_CREATED_AT, "html_body": "<p>Customer reply</p>"}
+            self._reply("comment_fetch", 200, {"comments": [comment]})
+            return
+
+        match = TICKET_RE.match(path)
+        if match and method == "GET":
+            ticket_id = int(match.group(1))
+            self._reply(
+                "ticket_get",
+                200,
+                {"ticket": {"id": ticket_id, "requester_id": 1}, "users": [{"id": 1, "name": "Bench Customer"}]},
+            )
+            return
+        if match and method == "PUT":
+            comment = json.loads(body or b"{}").get("ticket", {}).get("comment", {})
+            if "html_body" in comment and random.random() < config.rate_422:
+                self._reply("ticket_put", 422, {"error": "RecordInvalid", "description": "Body is invalid"})
+                return
+            self._reply("ticket_put", 200, {"ticket": {"id": int(match.group(1))}})
+            return
+
+        self._reply("unknown", 404, {"error": "InvalidEndpoint"})
+
+    def _reply(self, route, status, data, headers=None):
+        self.server.count(route, status)
+        payload = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.send_header("X-Rate-Limit", str(self.server.config.rate_limit))
+        self.send_header("X-Rate-Limit-Remaining", str(self.server.config.rate_limit))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeApiServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, config):
+        super().__init__(("127.0.0.1", 0), FakeApiHandler)
+        self.config = config
+        self.requests = {}
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def count(self, route, status):
+        with self._lock:
+            key = f"{route} {status}"
+            self.requests[key] = self.requests.get(key, 0) + 1
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name="fake-api", daemon=True).start()
+        return self
+
+
+# --- Helpers ---
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+class Quiet:
+    # The engine logs every send with print; keep that out of the timings and the report
+    # (background threads may still print afterwards, so the sink is never closed)
+    def __init__(self, enabled):
+        self.enabled = enabled
+        self._sink = open(os.devnull, "w", encoding="utf-8")
+        self._stdout = None
+
+    def __enter__(self):
+        if self.enabled:
+            self._stdout = sys.stdout
+            sys.stdout = self._sink
+
+    def __exit__(self, *exc):
+        if self.enabled:
+            sys.stdout = self._stdout
+
+
+class Results:
+    def __init__(self):
+        self.values = {}  # name -> (value, unit, higher_is_better)
+        self.out = sys.stdout  # Report lines bypass Quiet
+
+    def note(self, text):
+        print(f"  {text}", file=self.out)
+
+    def add(self, name, value, unit, higher_is_better=False):
+        self.values[name] = (value, unit, higher_is_better)
+        self.note(f"{name:<32} {value:>12.3f} {unit}")
+
+    def latency(self, prefix, samples):
+        self.add(f"{prefix}_p50", percentile(samples, 50) * 1000, "ms")
+        self.add(f"{prefix}_p99", percentile(samples, 99) * 1000, "ms")
+
+    def save(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({name: {"value": v, "unit": u, "higher_is_better": h} for name, (v, u, h) in self.values.items()}, f, indent=2)
+
+    def compare(self, path, tolerance):
+        # Non-zero exit when any result is worse than the baseline by more than the tolerance
+        with open(path, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = []
+        for name, (value, unit, higher_is_better) in self.values.items():
+            old = baseline.get(name, {}).get("value")
+            if not old:
+                continue
+            change = (value - old) / old
+            if (-change if higher_is_better else change) > tolerance:
+                regressions.append(f"  {name}: {old:.3f} -> {value:.3f} {unit} ({change:+.0%})")
+        if regressions:
+            print(f"\n[REGRESSION] Worse than {path} by more than {tolerance:.0%}:")
+            print("\n".join(regressions))
+            return False
+        print(f"\n[OK] Within {tolerance:.0%} of {path}.")
+        return True
+
+
+def legacy_convert_formatting(text):
+    # The regex version convert_formatting replaced; the formatter check holds it to the same output
+    text = re.sub(r"\[([^\]]+)]\s*\((https?://[^\)]+)\)", r'<a href="\2">\1</a>', text)
+    text = re.sub(r"\*\*((?:.|\n)*?)\*\*", r"<b>\1</b>", text)
+    text = re.sub(r"_(.*?)_", r"<i>\1</i>", text)
+    return text
+
+
+# --- Benchmarks ---
+def check_format(engine, results, count, seed=0):
+    rng = random.Random(seed)
+    mismatches = 0
+    for _ in range(count):
+        text = "".join(rng.choice(FORMAT_PIECES) for _ in range(rng.randint(0, 24)))
+        expected = legacy_convert_formatting(text)
+        if engine.convert_formatting(text) != expected:
+            mismatches += 1
+            if mismatches <= 5:
+                results.note(f"mismatch for {text!r}: expected {expected!r}")
+    if mismatches:
+        sys.exit(f"[MISMATCH] convert_formatting differs from the old regexes on {mismatches} of {count} texts")
+    results.note(f"{count} random texts match the old regexes")
+
+
+def bench_format(engine, results, count):
+    texts = [SAMPLE_MESSAGE % i for i in range(count)]
+    engine.format_message_with_html.cache_clear()
+    start = time.perf_counter()
+    for text in texts:
+        engine.format_message_with_html(text)
+    results.add("format_uncached_per_sec", count / (time.perf_counter() - start), "msg/s", True)
+
+    template_id = engine.templates.add(SAMPLE_MESSAGE % 0)
+    start = time.perf_counter()
+    for ticket in range(count):
+        engine.templates.render(template_id, {"ticket_id": str(ticket), "requester_name": "Bench Customer"})
+    results.add("template_render_per_sec", count / (time.perf_counter() - start), "msg/s", True)
+
+
+def bench_comment_fetch(engine, results, count):
+    account = engine.accounts.get()
+    samples = []
+    for ticket in range(1, count + 1):
+        start = time.perf_counter()
+        engine.get_last_comment(account, ticket)
+        samples.append(time.perf_counter() - start)
+    results.latency("comment_fetch", samples)
+
+
+def send_args(engine, ticket, message):
+    fingerprint = engine.comment_fingerprint({"id": ticket * 10, "created_at": COMMENT_CREATED_AT})
+    return engine.accounts.get(), ticket, message, fingerprint, True, False, True
+
+
+def bench_sync_sends(engine, results, count, workers):
+    message = engine.format_message_with_html(SAMPLE_MESSAGE % 0)
+    samples = []
+
+    def one(ticket):
+        start = time.perf_counter()
+        engine.send_message_to_ticket(*send_args(engine, ticket, message))
+        samples.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(workers) as pool:
+        list(pool.map(one, range(1, count + 1)))
+    results.add("sync_sends_per_sec", count / (time.perf_counter() - start), "jobs/s", True)
+    results.latency("sync_send", samples)
+
+
+def bench_async_sends(engine, results, count):
+    if engine.httpx is None:
+        results.note("skipped: httpx is not installed")
+        return
+    message = engine.format_message_with_html(SAMPLE_MESSAGE % 0)
+    samples = []
+    engine.async_engine.enabled = True
+
+    def timed(submitted):
+        return lambda _: samples.append(time.perf_counter() - submitted)
+
+    start = time.perf_counter()
+    futures = []
+    for ticket in range(1, count + 1):
+        future = engine.async_engine.submit(*send_args(engine, ticket, message))
+        future.add_done_callback(timed(time.perf_counter()))
+        futures.append(future)
+    wait(futures)
+    results.add("async_sends_per_sec", count / (time.perf_counter() - start), "jobs/s", True)
+    results.latency("async_send", samples)
+    engine.async_engine.enabled = False
+
+
+def bench_telegram(engine, results, count):
+    samples = []
+    for i in range(count):
+        start = time.perf_counter()
+        engine.post_telegram_message(BENCH_TELEGRAM_TOKEN, "1", f"Benchmark message {i}")
+        samples.append(time.perf_counter() - start)
+    results.latency("telegram_send", samples)
+
+
+def bench_schedule_and_persist(engine, results, count, interval_minutes):
+    template_id = engine.templates.add(SAMPLE_MESSAGE % 0)
+    for ticket in range(1, count + 1):
+        engine.registry.add(engine.JobRecord(engine.new_job_id(ticket), str(ticket), template_id))
+
+    start = time.perf_counter()
+    engine.schedule_queue(interval_minutes)
+    results.add("schedule_queue_seconds", time.perf_counter() - start, "s")
+
+    start = time.perf_counter()
+    engine.journal.compact(engine.snapshot_jobs)
+    results.add("save_snapshot_seconds", time.perf_counter() - start, "s")
+    results.add("snapshot_size", os.path.getsize(engine.journal.snapshot_path) / 1024, "KiB")
+
+    start = time.perf_counter()
+    engine.journal.load()
+    results.add("load_snapshot_seconds", time.perf_counter() - start, "s")
+
+    start = time.perf_counter()
+    engine.load_job_state()
+    results.add("load_and_reschedule_seconds", time.perf_counter() - start, "s")
+
+
+def run(args, server, workdir):
+    import zendesk_engine as engine
+
+    print(f"[BENCH] Fake API at {server.url}, working directory {workdir}")
+    results = Results()
+    quiet = Quiet(not args.verbose)
+    engine.set_credentials(BENCH_EMAIL, BENCH_PASSWORD)
+    engine.start_scheduler(args.workers)
+    engine.restore_job_state()
+    try:
+        steps = [
+            ("Formatter check", lambda: check_format(engine, results, args.format_checks)),
+            ("Formatting", lambda: bench_format(engine, results, args.sends)),
+            ("Comment fetch", lambda: bench_comment_fetch(engine, results, args.sends)),
+            ("Sync sends", lambda: bench_sync_sends(engine, results, args.sends, args.workers)),
+            ("Async sends", lambda: bench_async_sends(engine, results, args.sends)),
+            ("Telegram", lambda: bench_telegram(engine, results, args.sends)),
+            ("Scheduling and persistence", lambda: bench_schedule_and_persist(engine, results, args.jobs, args.interval)),
+        ]
+        for title, step in steps:
+            print(f"\n{title}")
+            with quiet:
+                step()
+    finally:
+        # Let running jobs finish and the job store close before the API and the directory go
+        engine.scheduler.shutdown(wait=True)
+        server.shutdown()
+    return results
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the send pipeline against a local fake Zendesk/Telegram API.")
+    parser.add_argument("--sends", type=int, default=500, help="Sends per send benchmark")
+    parser.add_argument("--jobs", type=int, default=5000, help="Jobs to schedule, save and load")
+    parser.add_argument("--workers", type=int, default=10, help="Threads for the sync send benchmark")
+    parser.add_argument("--format-checks", type=int, default=20000, help="Random texts checked against the old formatter")
+    parser.add_argument("--interval", type=int, default=60, help="Minutes between scheduled slots")
+    parser.add_argument("--latency-ms", type=float, default=20, help="Fake API base latency")
+    parser.add_argument("--jitter-ms", type=float, default=10, help="Random extra latency, up to this much")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="Share of Zendesk calls answered with 429")
+    parser.add_argument("--retry-after", type=float, default=1, help="Retry-After seconds sent with each 429")
+    parser.add_argument("--rate-422", type=float, default=0.0, help="Share of HTML ticket updates answered with 422")
+    parser.add_argument("--rate-limit", type=int, default=100_000, help="X-Rate-Limit the fake API reports")
+    parser.add_argument("--save", help="Write the results as JSON, e.g. as a baseline")
+    parser.add_argument("--compare", help="Baseline JSON to check the results against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown against the baseline")
+    parser.add_argument("--verbose", action="store_true", help="Keep the engine's own log output")
+    args = parser.parse_args()
+    if args.save:
+        args.save = os.path.abspath(args.save)
+    if args.compare:
+        args.compare = os.path.abspath(args.compare)
+
+    server = FakeApiServer(args).start()
+
+    # The engine opens its job store, journal and archive in the working directory and
+    # reads the API base URLs on import, so point both somewhere disposable first
+    os.environ["ZENDESK_BASE_URL"] = server.url
+    os.environ["TELEGRAM_API_URL"] = server.url
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    original_cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="zendesk-bench-", ignore_cleanup_errors=True) as workdir:
+        os.chdir(workdir)
+        try:
+            results = run(args, server, workdir)
+        finally:
+            os.chdir(original_cwd)  # Windows can't remove the directory we're standing in
+
+    print("\nFake API requests:")
+    for key, total in sorted(server.requests.items()):
+        print(f"  {key:<32} {total:>12}")
+
+    if args.save:
+        results.save(args.save)
+        print(f"\n[BENCH] Results saved to {args.save}")
+    if args.compare and not results.compare(args.compare, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import argparse
+import json
+import os
+import signal
+import threading
+
+from zendesk_engine import (
+    ACCOUNTS_FILE,
+    JOURNAL_CHECK_MS,
+    METRICS_PORT,
+    SLOT_SEND_CONCURRENCY,
+    accounts,
+    async_engine,
+    bulk_dispatcher,
+    compact_journal_if_needed,
+    journal,
+    load_accounts_file,
+    load_telegram_settings_file,
+    restore_job_state,
+    scheduled_times,
+    scheduler,
+    set_credentials,
+    snapshot_jobs,
+    start_metrics_server,
+    start_scheduler,
+    telegram_notifier,
+    write_metrics_file,
+)
+
+CONFIG_FILE = "zendesk_config.json"
+
+
+def load_config(path):
+    config = {}
+    try:
+        with open(path, "r") as f:
+            config = json.load(f)
+        print(f"[DAEMON] Config loaded from {path}.")
+    except FileNotFoundError:
+        print(f"[DAEMON] No config file at {path}, using environment only.")
+
+    # Environment wins, so credentials don't have to live on disk
+    config["email"] = os.environ.get("ZENDESK_EMAIL", config.get("email", ""))
+    config["password"] = os.environ.get("ZENDESK_PASSWORD", config.get("password", ""))
+    return config
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the Zendesk scheduler without the GUI.")
+    parser.add_argument("--config", default=CONFIG_FILE, help="JSON file with email, password and options")
+    parser.add_argument("--accounts", default=ACCOUNTS_FILE, help="JSON file with further Zendesk accounts (brands)")
+    parser.add_argument("--bulk", action="store_true", help="Batch jobs due together via update_many")
+    parser.add_argument("--async-send", action="store_true", help="Use the asyncio send engine")
+    parser.add_argument("--slot-concurrency", type=int, help="Sends of one slot that may run in parallel")
+    parser.add_argument("--metrics-port", type=int, help=f"Local /metrics port (default {METRICS_PORT}, 0 disables)")
+    parser.add_argument("--metrics-file", help="Also write the metrics to this file while running")
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+    load_accounts_file(args.accounts)
+    if config["email"] or config["password"]:
+        set_credentials(config["email"], config["password"])
+    if not any(accounts.get(name).ready() for name in accounts.names()):
+        parser.error(
+            "Zendesk credentials missing: set ZENDESK_EMAIL/ZENDESK_PASSWORD, add them to the config file "
+            "or list accounts in the accounts file."
+        )
+    load_telegram_settings_file()
+    bulk_dispatcher.enabled = args.bulk or config.get("bulk_send", False)
+    async_engine.enabled = args.async_send or config.get("async_send", False)
+
+    metrics_port = args.metrics_port if args.metrics_port is not None else config.get("metrics_port", METRICS_PORT)
+    metrics_file = args.metrics_file or config.get("metrics_file")
+    start_metrics_server(metrics_port)
+
+    start_scheduler(args.slot_concurrency or config.get("slot_concurrency", SLOT_SEND_CONCURRENCY))
+    restore_job_state()
+    print(f"[DAEMON] Running with {len(scheduled_times)} pending jobs. Ctrl+C to stop.")
+
+    stop = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+
+    while not stop.wait(JOURNAL_CHECK_MS / 1000):
+        compact_journal_if_needed()
+        if metrics_file:
+            write_metrics_file(metrics_file)
+
+    print("[DAEMON] Shutting down...")
+    scheduler.shutdown(wait=True)
+    telegram_notifier.flush()
+    journal.compact(snapshot_jobs)
+
+
+if __name__ == "__main__":
+    main()
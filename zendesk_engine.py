@@ -0,0 +1,2528 @@
+from datetime import datetime, timedelta
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.jobstores.base import BaseJobStore, ConflictingIdError, JobLookupError
+from apscheduler.events import EVENT_JOB_MISSED
+from apscheduler.executors.pool import ThreadPoolExecutor as SchedulerThreadPool
+from apscheduler.job import Job
+from apscheduler.util import datetime_to_utc_timestamp, utc_timestamp_to_datetime
+import threading
+import queue
+import heapq
+import itertools
+from dataclasses import dataclass
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import time
+import functools
+import random
+import re
+import requests
+from requests.adapters import HTTPAdapter
+import json
+import csv
+import pickle
+import sqlite3
+import hashlib
+import html
+import os
+import glob
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from collections import deque
+import uuid
+from email.utils import parsedate_to_datetime
+from bs4 import BeautifulSoup
+
+try:
+    import httpx  # Optional: enables the async send engine's native HTTP client
+except ImportError:
+    httpx = None
+
+
+REAL_USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/138.0.0.0 Safari/537.36"
+
+ZENDESK_BASE_URL = os.environ.get("ZENDESK_BASE_URL", "https://inventry.zendesk.com")  # Overridable for benchmark.py
+DEFAULT_ACCOUNT = "default"  # The instance at ZENDESK_BASE_URL; jobs without an account go here
+ACCOUNTS_FILE = "zendesk_accounts.json"  # {"name": {"subdomain": ..., "email": ..., "password": ...}}
+ZENDESK_POOL_SIZE = 10  # Max keep-alive connections per client
+ZENDESK_TIMEOUT = 30
+ZENDESK_RATE_LIMIT = 700  # Requests per minute until Zendesk reports the real X-Rate-Limit
+RATE_LIMIT_MAX_RETRIES = 5  # 429 responses to wait out before giving the response back
+
+BULK_WINDOW_SECONDS = 5  # How long to collect due jobs before one update_many call
+BULK_MAX_TICKETS = 100  # Zendesk limit per update_many request
+JOB_STATUS_POLL_SECONDS = 2
+JOB_STATUS_TIMEOUT = 300
+
+ASYNC_SEND_CONCURRENCY = 50  # Max in-flight sends when the async engine is on
+
+JOB_STORE_FILE = "scheduled_jobs.sqlite"
+MISFIRE_GRACE_SECONDS = 12 * 3600  # Jobs that came due while the app was down still run if this late
+CREDENTIALS_WAIT_SECONDS = 60  # Retry delay for jobs that fire before credentials are entered
+
+SLOT_CAPACITY = 1  # Default number of sends the allocator puts in one interval slot
+SLOT_SEND_CONCURRENCY = 10  # Worker threads running the sends of a slot in parallel
+SLOT_JITTER_FRACTION = 0.5  # With jitter on, sends spread over this share of their slot
+SEND_EXECUTOR = "sends"
+
+TELEGRAM_API_URL = os.environ.get("TELEGRAM_API_URL", "https://api.telegram.org")
+TELEGRAM_DIGEST_SECONDS = 3  # Notifications arriving this close together go out as one digest
+TELEGRAM_MIN_INTERVAL = 1.0  # Telegram allows about one message per second per chat
+TELEGRAM_MAX_MESSAGE = 4000  # Stay under Telegram's 4096-character limit
+TELEGRAM_MAX_RETRIES = 5
+
+SEND_MAX_ATTEMPTS = 5  # Failed sends are retried until this many attempts, then dead-lettered
+RETRY_BASE_SECONDS = 60  # First retry delay; doubles per attempt
+RETRY_MAX_SECONDS = 3600
+RETRY_IDEMPOTENCY_COMMENTS = 5  # Recent comments checked for our reply before a retry posts again
+PERMANENT_FAILURES = (400, 401, 403, 404, 422)  # Not worth retrying
+
+SENT_LOG_MEMORY = 1000  # Recent sends kept in memory; the full history is in the archive
+SENT_ARCHIVE_DIR = "sent_archive"  # One JSONL file per day
+SENT_ARCHIVE_DAYS = 90  # Daily files older than this are deleted
+
+PREFETCH_WORKERS = 8  # Concurrent last-comment fetches when queueing a batch of tickets
+
+METRICS_PORT = 9464  # Local Prometheus-style endpoint (127.0.0.1 only); 0 turns it off
+METRICS_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900)
+
+REQUESTER_NAME_FALLBACK = "there"  # Used for {{requester_name}} when the lookup fails
+
+IMPORT_CHUNK_SIZE = 500  # Tickets prefetched and queued per step of a bulk import
+SEARCH_PAGE_SIZE = 1000  # search/export.json maximum
+VIEW_PAGE_SIZE = 100  # views/{id}/tickets.json maximum
+
+FORMAT_CACHE_SIZE = 512  # Distinct message texts whose HTML is kept; macros repeat a lot
+
+# Filled in by the GUI or the headless daemon; read by scheduler and worker threads
+telegram_settings = {"token": "", "chat_id": ""}
+sent_listeners = []  # Called with each sent-log line, possibly from a worker thread
+
+
+# --- Metrics ---
+class Metrics:
+    # Thread-safe counters, latency histograms and callback gauges, rendered in the
+    # Prometheus text format for the local endpoint or the metrics file
+    def __init__(self, buckets=METRICS_BUCKETS):
+        self.buckets = buckets
+        self._meta = {}
+        self._counters = {}
+        self._histograms = {}
+        self._gauges = {}
+        self._lock = threading.Lock()
+
+    def describe(self, name, kind, help_text):
+        self._meta[name] = (kind, help_text)
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [0] * len(self.buckets) + [0, 0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram[i] += 1
+            histogram[-2] += 1
+            histogram[-1] += value
+
+    def gauge(self, name, help_text, read, label=None):
+        # With a label, read() returns {label value: reading}
+        self.describe(name, "gauge", help_text)
+        self._gauges[name] = (read, label)
+
+    def render(self):
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: list(values) for key, values in self._histograms.items()}
+
+        series = {}
+        for (name, labels), value in counters.items():
+            series.setdefault(name, []).append(f"{name}{self._labels(labels)} {value}")
+        for (name, labels), values in histograms.items():
+            lines = series.setdefault(name, [])
+            for bound, count in zip(self.buckets, values):
+                lines.append(f"{name}_bucket{self._labels(labels + (('le', bound),))} {count}")
+            lines.append(f"{name}_bucket{self._labels(labels + (('le', '+Inf'),))} {values[-2]}")
+            lines.append(f"{name}_count{self._labels(labels)} {values[-2]}")
+            lines.append(f"{name}_sum{self._labels(labels)} {values[-1]:.6f}")
+        for name, (read, label) in self._gauges.items():
+            try:
+                if label:
+                    series[name] = [f"{name}{self._labels(((label, key),))} {value}" for key, value in read().items()]
+                else:
+                    series[name] = [f"{name} {read()}"]
+            except Exception as e:
+                print(f"[METRICS] Gauge {name} failed: {e}")
+
+        out = []
+        for name in sorted(series):
+            kind, help_text = self._meta.get(name, ("untyped", ""))
+            out.append(f"# HELP {name} {help_text}")
+            out.append(f"# TYPE {name} {kind}")
+            out.extend(series[name])
+        return "\n".join(out) + "\n"
+
+    @staticmethod
+    def _labels(labels):
+        if not labels:
+            return ""
+        return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+metrics = Metrics()
+metrics.describe("zendesk_request_seconds", "histogram", "Zendesk API call latency by account and operation")
+metrics.describe("zendesk_requests_total", "counter", "Zendesk API calls by account, operation and HTTP status")
+metrics.describe("zendesk_plain_text_retries_total", "counter", "Ticket updates retried as plain text after a 422")
+metrics.describe("sends_total", "counter", "Send outcomes by result")
+metrics.describe("scheduler_lag_seconds", "histogram", "Delay between a job's run time and when it started")
+metrics.describe("telegram_send_seconds", "histogram", "Telegram sendMessage latency")
+metrics.describe("telegram_messages_total", "counter", "Telegram sendMessage calls by HTTP status")
+
+
+def zendesk_operation(method, path):
+    # Low-cardinality label for a Zendesk API path
+    if "comments.json" in path:
+        return "comment_fetch"
+    if "update_many" in path:
+        return "bulk_update"
+    if "job_statuses" in path:
+        return "job_status"
+    if "search" in path or "views/" in path:
+        return "import"
+    if "tickets/" in path:
+        return "ticket_put" if method == "PUT" else "ticket_get"
+    return "other"
+
+
+def record_zendesk_call(account, method, path, status, seconds):
+    op = zendesk_operation(method, path)
+    metrics.observe("zendesk_request_seconds", seconds, account=account, op=op)
+    metrics.inc("zendesk_requests_total", account=account, op=op, status=status)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Keep the console for send logs
+
+
+def start_metrics_server(port=METRICS_PORT, host="127.0.0.1"):
+    if not port:
+        return None
+    try:
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+    except OSError as e:
+        print(f"[METRICS] Could not listen on {host}:{port}: {e}")
+        return None
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    print(f"[METRICS] Serving http://{host}:{port}/metrics")
+    return server
+
+
+def write_metrics_file(path):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(metrics.render())
+    os.replace(tmp_path, path)
+
+
+# --- Scheduling Helpers ---
+def schedule_queue(interval_minutes, capacity=None, jitter=False):
+    # ✅ Fill the earliest free slots, around manual jobs and gaps left by deletes
+    scheduled = registry.jobs("queue")
+    run_times = slot_allocator.allocate(len(scheduled), interval_minutes, capacity)
+    jitter_seconds = int(interval_minutes * 60 * SLOT_JITTER_FRACTION) if jitter else 0
+    for job, run_time in zip(scheduled, run_times):
+        if jitter_seconds:
+            # Still inside the slot, so the allocator counts it in the same place
+            run_time += timedelta(seconds=random.randint(0, jitter_seconds))
+        registry.update(job.job_id, time=run_time, state="scheduled")
+
+        schedule_send(job)
+        journal.record("edit", "scheduled_jobs", job)
+
+    return scheduled
+
+
+def get_next_interval_time(interval_minutes, after=None):
+    now = datetime.now().replace(second=0, microsecond=0)
+    base_time = after if after and after > now else now
+
+    remainder = base_time.minute % interval_minutes
+    if remainder == 0 and base_time > now:
+        return base_time
+    else:
+        minutes_to_add = interval_minutes - remainder if remainder else interval_minutes
+        return base_time + timedelta(minutes=minutes_to_add)
+
+
+
+def save_telegram_settings(token: str, chat_id: str):
+    telegram_settings.update(token=token, chat_id=chat_id)
+    try:
+        with open("telegram_config.json", "w") as f:
+            json.dump({"token": token, "chat_id": chat_id}, f)
+        print("[TELEGRAM] Settings saved.")
+    except Exception as e:
+        print(f"[ERROR] Could not save Telegram settings: {e}")
+
+
+def load_telegram_settings_file():
+    try:
+        with open("telegram_config.json", "r") as f:
+            config = json.load(f)
+            telegram_settings.update(
+                token=config.get("token", ""), chat_id=config.get("chat_id", "")
+            )
+        print("[TELEGRAM] Settings loaded.")
+    except FileNotFoundError:
+        print("[TELEGRAM] No saved settings found.")
+    except Exception as e:
+        print(f"[ERROR] Could not load Telegram settings: {e}")
+    return dict(telegram_settings)
+
+
+# --- Telegram Functions ---
+def post_telegram_message(bot_token: str, chat_id: str, text: str):
+    # Returns (status code, retry_after seconds); status is None on network errors
+    url = f"{TELEGRAM_API_URL}/bot{bot_token}/sendMessage"
+    payload = {"chat_id": chat_id, "text": text}
+    start = time.perf_counter()
+    try:
+        res = requests.post(url, data=payload, timeout=10)
+    except Exception as e:
+        print(f"[TELEGRAM EXCEPTION] {e}")
+        metrics.inc("telegram_messages_total", status="error")
+        return None, None
+    metrics.observe("telegram_send_seconds", time.perf_counter() - start)
+    metrics.inc("telegram_messages_total", status=res.status_code)
+    if res.status_code == 200:
+        print("[TELEGRAM] Message sent.")
+        return 200, None
+    print(f"[TELEGRAM ERROR] Status {res.status_code}: {res.text}")
+    retry_after = None
+    if res.status_code == 429:
+        try:
+            retry_after = float(res.json().get("parameters", {}).get("retry_after", 0)) or None
+        except ValueError:
+            pass
+    return res.status_code, retry_after
+
+
+def send_telegram_message(bot_token: str, chat_id: str, text: str) -> bool:
+    if not bot_token or not chat_id:
+        print("[TELEGRAM] Bot token or chat ID missing.")
+        return False
+    status, _ = post_telegram_message(bot_token, chat_id, text)
+    return status == 200
+
+
+class TelegramNotifier:
+    # Sent notifications go on a queue drained by one sender thread, so ticket updates
+    # never wait on Telegram. A burst arriving within TELEGRAM_DIGEST_SECONDS becomes
+    # one digest message; 429s honour retry_after and other failures back off.
+    def __init__(self, digest_seconds=TELEGRAM_DIGEST_SECONDS):
+        self.digest_seconds = digest_seconds
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._last_sent = 0.0
+
+    def notify(self, text):
+        self._queue.put(text)
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="telegram-notifier", daemon=True)
+                self._thread.start()
+
+    def flush(self, timeout=30):
+        # Give queued notifications a chance to go out, e.g. before shutdown
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.1)
+
+    def _run(self):
+        while True:
+            lines = [self._queue.get()]
+            deadline = time.monotonic() + self.digest_seconds
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    lines.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                for text in self._digests(lines):
+                    self._deliver(text)
+            finally:
+                for _ in lines:
+                    self._queue.task_done()
+
+    @staticmethod
+    def _digests(lines):
+        if len(lines) == 1:
+            return lines
+        messages = []
+        current = f"🔔 {len(lines)} tickets updated:"
+        for line in lines:
+            if len(current) + len(line) + 1 > TELEGRAM_MAX_MESSAGE:
+                messages.append(current)
+                current = line
+            else:
+                current += "\n" + line
+        messages.append(current)
+        return messages
+
+    def _deliver(self, text):
+        delay = 1
+        for _ in range(TELEGRAM_MAX_RETRIES):
+            # Settings are read per attempt, so a fixed token or chat ID takes effect
+            bot_token = telegram_settings["token"]
+            chat_id = telegram_settings["chat_id"]
+            if not (bot_token and chat_id):
+                print("[TELEGRAM] Bot token or chat ID missing, notification dropped.")
+                return
+
+            wait = self._last_sent + TELEGRAM_MIN_INTERVAL - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            status, retry_after = post_telegram_message(bot_token, chat_id, text)
+            self._last_sent = time.monotonic()
+            if status == 200:
+                return
+            if status is not None and status != 429 and status < 500:
+                return  # Bad token/chat or malformed message: retrying won't help
+
+            time.sleep(retry_after or delay)
+            delay = min(delay * 2, 60)
+        print(f"[TELEGRAM] Giving up after {TELEGRAM_MAX_RETRIES} attempts, notification dropped.")
+
+
+telegram_notifier = TelegramNotifier()
+
+
+def fetch_chat_id_from_token(bot_token: str):
+    try:
+        url = f"{TELEGRAM_API_URL}/bot{bot_token}/getUpdates"
+        response = requests.get(url, timeout=10)
+        if response.status_code == 200:
+            updates = response.json()
+            print("Updates:", updates)  # Debug print
+            messages = updates.get("result", [])
+            if messages:
+                return messages[-1]["message"]["chat"]["id"]
+            else:
+                print("[Chat ID] No messages found in updates.")
+        else:
+            print(f"[Chat ID Error] Status {response.status_code}: {response.text}")
+    except Exception as e:
+        print(f"[Chat ID Exception] {e}")
+    return None
+
+
+# --- Persistent job store ---
+class _ClosedCursor:
+    # Stands in for a cursor once the store is shut down: no rows, nothing changed
+    rowcount = -1
+
+    def fetchone(self):
+        return None
+
+    def fetchall(self):
+        return []
+
+
+class SQLiteJobStore(BaseJobStore):
+    # Durable APScheduler job store on the stdlib sqlite3 module. Each add/update/remove
+    # touches one row, and next-run lookups use an index, so thousands of pending jobs
+    # cost nothing at startup until they come due.
+    def __init__(self, path=JOB_STORE_FILE, pickle_protocol=pickle.HIGHEST_PROTOCOL):
+        super().__init__()
+        self.path = path
+        self.pickle_protocol = pickle_protocol
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS apscheduler_jobs "
+            "(id TEXT PRIMARY KEY, next_run_time REAL, job_state BLOB NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_apscheduler_jobs_next_run_time "
+            "ON apscheduler_jobs (next_run_time)"
+        )
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            if self._conn is None:
+                # The scheduler thread can still poll once after shutdown() has closed us
+                return _ClosedCursor()
+            return self._conn.execute(sql, params)
+
+    def lookup_job(self, job_id):
+        row = self._execute(
+            "SELECT job_state FROM apscheduler_jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        return self._reconstitute_job(row[0]) if row else None
+
+    def get_due_jobs(self, now):
+        return self._get_jobs("next_run_time <= ?", (datetime_to_utc_timestamp(now),))
+
+    def get_next_run_time(self):
+        row = self._execute(
+            "SELECT next_run_time FROM apscheduler_jobs "
+            "WHERE next_run_time IS NOT NULL ORDER BY next_run_time LIMIT 1"
+        ).fetchone()
+        return utc_timestamp_to_datetime(row[0]) if row else None
+
+    def get_all_jobs(self):
+        jobs = self._get_jobs()
+        self._fix_paused_jobs_sorting(jobs)
+        return jobs
+
+    def add_job(self, job):
+        try:
+            self._execute(
+                "INSERT INTO apscheduler_jobs (id, next_run_time, job_state) VALUES (?, ?, ?)",
+                (
+                    job.id,
+                    datetime_to_utc_timestamp(job.next_run_time),
+                    pickle.dumps(job.__getstate__(), self.pickle_protocol),
+                ),
+            )
+        except sqlite3.IntegrityError:
+            raise ConflictingIdError(job.id)
+
+    def update_job(self, job):
+        cursor = self._execute(
+            "UPDATE apscheduler_jobs SET next_run_time = ?, job_state = ? WHERE id = ?",
+            (
+                datetime_to_utc_timestamp(job.next_run_time),
+                pickle.dumps(job.__getstate__(), self.pickle_protocol),
+                job.id,
+            ),
+        )
+        if cursor.rowcount == 0:
+            raise JobLookupError(job.id)
+
+    def remove_job(self, job_id):
+        cursor = self._execute("DELETE FROM apscheduler_jobs WHERE id = ?", (job_id,))
+        if cursor.rowcount == 0:
+            raise JobLookupError(job_id)
+
+    def remove_all_jobs(self):
+        self._execute("DELETE FROM apscheduler_jobs")
+
+    def job_ids(self):
+        return {row[0] for row in self._execute("SELECT id FROM apscheduler_jobs").fetchall()}
+
+    def shutdown(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _reconstitute_job(self, job_state):
+        job_state = pickle.loads(job_state)
+        job_state["jobstore"] = self
+        job = Job.__new__(Job)
+        job.__setstate__(job_state)
+        job._scheduler = self._scheduler
+        job._jobstore_alias = self._alias
+        return job
+
+    def _get_jobs(self, condition="1", params=()):
+        jobs = []
+        failed_job_ids = []
+        rows = self._execute(
+            f"SELECT id, job_state FROM apscheduler_jobs WHERE {condition} ORDER BY next_run_time",
+            params,
+        ).fetchall()
+        for job_id, job_state in rows:
+            try:
+                jobs.append(self._reconstitute_job(job_state))
+            except BaseException:
+                self._logger.exception('Unable to restore job "%s" -- removing it', job_id)
+                failed_job_ids.append(job_id)
+
+        for job_id in failed_job_ids:
+            self._execute("DELETE FROM apscheduler_jobs WHERE id = ?", (job_id,))
+        return jobs
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} (path={self.path})>"
+
+
+# --- Next fire time index ---
+class FireTimeIndex:
+    # Pending run times in a min-heap with lazy deletion: add/discard are O(log n),
+    # the next run time is read off the top. Listeners are told about changes on
+    # flush(), which the registry calls only after releasing its own lock, so a
+    # listener can never hold up a thread that other threads are waiting on.
+    def __init__(self):
+        self.listeners = []
+        self._heap = []
+        self._counts = {}
+        self._size = 0
+        self._changed = False
+        self._lock = threading.Lock()
+
+    def add(self, run_time):
+        with self._lock:
+            if run_time not in self._counts:
+                self._counts[run_time] = 0
+                heapq.heappush(self._heap, run_time)
+            self._counts[run_time] += 1
+            self._size += 1
+            self._changed = True
+
+    def discard(self, run_time):
+        with self._lock:
+            count = self._counts.get(run_time)
+            if not count:
+                return
+            if count == 1:
+                del self._counts[run_time]
+                if len(self._heap) > 2 * len(self._counts) + 64:
+                    self._heap = list(self._counts)
+                    heapq.heapify(self._heap)
+            else:
+                self._counts[run_time] = count - 1
+            self._size -= 1
+            self._changed = True
+
+    def clear(self):
+        with self._lock:
+            self._heap.clear()
+            self._counts.clear()
+            self._size = 0
+            self._changed = True
+
+    def next_after(self, now):
+        # Run times at or before now have fired, so they are dropped on the way
+        with self._lock:
+            while self._heap:
+                run_time = self._heap[0]
+                if run_time in self._counts and run_time > now:
+                    return run_time
+                heapq.heappop(self._heap)
+                self._size -= self._counts.pop(run_time, 0)
+            return None
+
+    def __contains__(self, run_time):
+        return run_time in self._counts
+
+    def __len__(self):
+        return self._size
+
+    def flush(self):
+        with self._lock:
+            changed, self._changed = self._changed, False
+        if changed:
+            for listener in self.listeners:
+                listener()
+
+
+# --- Scheduler setup ---
+job_store = SQLiteJobStore(JOB_STORE_FILE)
+scheduler = BackgroundScheduler(
+    jobstores={"default": job_store},
+    job_defaults={"misfire_grace_time": MISFIRE_GRACE_SECONDS, "coalesce": False},
+)
+sent_log = deque(maxlen=SENT_LOG_MEMORY)
+
+
+# --- Job registry ---
+# Job state -> list name used by the snapshot and the journal
+JOB_STATES = {"queue": "job_queue", "manual": "manual_jobs", "scheduled": "scheduled_jobs"}
+
+
+@dataclass(slots=True)
+class JobRecord:
+    job_id: str
+    ticket: str
+    template_id: str
+    variables: dict = None  # Per-ticket placeholder values; {{ticket_id}} is always filled in
+    last_comment_fp: str = ""
+    check_last: bool = True
+    solve_ticket: bool = False
+    public_reply: bool = True
+    time: datetime = None
+    state: str = "queue"
+    account: str = DEFAULT_ACCOUNT  # Name in the account registry; credentials stay out of the job
+
+    @property
+    def raw_message(self):
+        return templates.raw(self.template_id)
+
+    def template_variables(self):
+        return {"ticket_id": self.ticket, **(self.variables or {})}
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data, state=None):
+        data = upgrade_legacy_job(dict(data))
+        time_obj = data.get("time")
+        if isinstance(time_obj, str):
+            time_obj = datetime.strptime(time_obj, "%Y-%m-%d %H:%M:%S")
+        if state is None:
+            # Older saves and job store entries only carry a "manual" flag
+            state = data.get("state") or ("manual" if data.get("manual") else "scheduled" if time_obj else "queue")
+        template_id = data.get("template_id")
+        if not template_id:
+            # Saved before templates: the job carried its own text and HTML
+            if data.get("raw_message"):
+                template_id = templates.add(data["raw_message"])
+            else:
+                template_id = templates.add(clean_html(data.get("message", "")), data.get("message", ""))
+        return cls(
+            job_id=data.get("job_id") or new_job_id(data["ticket"]),
+            ticket=str(data["ticket"]),
+            template_id=template_id,
+            variables=data.get("variables") or None,
+            last_comment_fp=data.get("last_comment_fp", ""),
+            check_last=data.get("check_last", True),
+            solve_ticket=data.get("solve_ticket", False),
+            public_reply=data.get("public_reply", True),
+            time=time_obj,
+            state=state,
+            account=data.get("account") or DEFAULT_ACCOUNT,
+        )
+
+
+class JobRegistry:
+    # Every job keyed by job_id, with secondary indexes by ticket, by state (in list
+    # order, for the views) and by run time. All changes go through here so the
+    # indexes never drift apart; lookups and updates are O(1), run times O(log n).
+    def __init__(self):
+        self.run_times = FireTimeIndex()  # Pending (future) run times only
+        self._jobs = {}
+        self._by_ticket = {}
+        self._by_state = {state: {} for state in JOB_STATES}
+        self._by_time = {}
+        self._pending = set()
+        self._lock = threading.RLock()
+
+    def add(self, job):
+        with self._lock:
+            if job.job_id in self._jobs:
+                self._remove(job.job_id)
+            self._jobs[job.job_id] = job
+            self._by_ticket.setdefault(job.ticket, {})[job.job_id] = job
+            self._by_state[job.state][job.job_id] = job
+            self._index_time(job)
+        self.run_times.flush()
+        return job
+
+    def remove(self, job_id):
+        with self._lock:
+            job = self._remove(job_id)
+        self.run_times.flush()
+        return job
+
+    def update(self, job_id, **changes):
+        # Changing state moves the job to the end of its new list; otherwise it keeps its place
+        with self._lock:
+            job = self._jobs[job_id]
+            if "ticket" in changes and changes["ticket"] != job.ticket:
+                self._drop(self._by_ticket, job.ticket, job_id)
+                self._by_ticket.setdefault(changes["ticket"], {})[job_id] = job
+            if "state" in changes and changes["state"] != job.state:
+                del self._by_state[job.state][job_id]
+                self._by_state[changes["state"]][job_id] = job
+            retime = "time" in changes or "state" in changes
+            if retime:
+                self._unindex_time(job)
+            for name, value in changes.items():
+                setattr(job, name, value)
+            if retime:
+                self._index_time(job)
+        self.run_times.flush()
+        return job
+
+    def fired(self, job_id):
+        # The job ran: its time is no longer pending, but it stays listed
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job_id in self._pending:
+                self._pending.discard(job_id)
+                self.run_times.discard(job.time)
+        self.run_times.flush()
+
+    def clear(self, state=None):
+        with self._lock:
+            job_ids = list(self._by_state[state]) if state else list(self._jobs)
+            for job_id in job_ids:
+                self._remove(job_id)
+        self.run_times.flush()
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def jobs(self, state):
+        with self._lock:
+            return list(self._by_state[state].values())
+
+    def for_ticket(self, ticket):
+        with self._lock:
+            return list(self._by_ticket.get(ticket, {}).values())
+
+    def times_after(self, after):
+        # (run_time, job count) for every indexed time at or after `after`
+        with self._lock:
+            return [(run_time, len(jobs)) for run_time, jobs in self._by_time.items() if run_time >= after]
+
+    def count(self, state=None):
+        return len(self._by_state[state]) if state else len(self._jobs)
+
+    def __contains__(self, job_id):
+        return job_id in self._jobs
+
+    def __len__(self):
+        return len(self._jobs)
+
+    def _remove(self, job_id):
+        job = self._jobs.pop(job_id, None)
+        if job is None:
+            return None
+        self._drop(self._by_ticket, job.ticket, job_id)
+        del self._by_state[job.state][job_id]
+        self._unindex_time(job)
+        return job
+
+    def _index_time(self, job):
+        if job.time is None or job.state == "queue":
+            return
+        self._by_time.setdefault(job.time, {})[job.job_id] = job
+        if job.time > datetime.now():
+            self._pending.add(job.job_id)
+            self.run_times.add(job.time)
+
+    def _unindex_time(self, job):
+        if job.time is None or job.job_id not in self._by_time.get(job.time, ()):
+            return
+        self._drop(self._by_time, job.time, job.job_id)
+        if job.job_id in self._pending:
+            self._pending.discard(job.job_id)
+            self.run_times.discard(job.time)
+
+    @staticmethod
+    def _drop(index, key, job_id):
+        bucket = index.get(key)
+        if bucket is not None:
+            bucket.pop(job_id, None)
+            if not bucket:
+                del index[key]
+
+
+registry = JobRegistry()
+scheduled_times = registry.run_times
+
+
+class SlotAllocator:
+    # Hands out interval slots from a sparse occupancy map built off the registry's
+    # run-time index. Manual jobs count against the slot they fall in, slots freed by
+    # deletes are reused and full ones skipped, so placing n jobs costs O(n + k) for
+    # k distinct pending run times.
+    def __init__(self, registry, capacity=SLOT_CAPACITY):
+        self.registry = registry
+        self.capacity = capacity
+
+    @staticmethod
+    def slot_of(run_time, interval_minutes):
+        return run_time.replace(minute=run_time.minute - run_time.minute % interval_minutes, second=0, microsecond=0)
+
+    def occupancy(self, interval_minutes, after):
+        counts = {}
+        for run_time, jobs in self.registry.times_after(after):
+            slot = self.slot_of(run_time, interval_minutes)
+            counts[slot] = counts.get(slot, 0) + jobs
+        return counts
+
+    def allocate(self, count, interval_minutes, capacity=None):
+        capacity = max(1, capacity or self.capacity)
+        slot = get_next_interval_time(interval_minutes)
+        occupied = self.occupancy(interval_minutes, slot)
+
+        run_times = []
+        while len(run_times) < count:
+            free = capacity - occupied.get(slot, 0)
+            if free > 0:
+                run_times.extend([slot] * min(free, count - len(run_times)))
+            slot += timedelta(minutes=interval_minutes)
+        return run_times
+
+
+slot_allocator = SlotAllocator(registry)
+
+
+# --- HTML Cleaning and Formatting ---
+def clean_html(raw_html):
+    soup = BeautifulSoup(raw_html, "html.parser")
+    return soup.get_text(separator="\n").strip()
+
+
+PERSISTENCE_FILE = "job_data.json"
+JOURNAL_FILE = "job_journal.jsonl"
+JOURNAL_COMPACT_EVENTS = 500  # Fold the journal into the snapshot once it holds this many events
+JOURNAL_CHECK_MS = 60_000
+
+JOB_LISTS = tuple(JOB_STATES.values())
+
+
+def new_job_id(ticket):
+    # Stable for the job's whole life, so journal events and the scheduler agree on it
+    return f"{ticket}_{uuid.uuid4().hex[:8]}"
+
+
+def serialize_job(job):
+    # Records never hold credentials; convert time to string only if it's set
+    new_job = job.to_dict()
+    del new_job["state"]  # Implied by the list the job is saved under
+    if isinstance(new_job.get("time"), datetime):
+        new_job["time"] = new_job["time"].strftime("%Y-%m-%d %H:%M:%S")
+    return new_job
+
+
+def write_json_atomic(path, data):
+    # Write to a temp file and swap it in, so a crash never leaves a half-written file
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, separators=(",", ":"))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+# --- Job journal ---
+class JobJournal:
+    # Append-only JSON Lines log of add/edit/delete/clear/sent events, replayed on top
+    # of the PERSISTENCE_FILE snapshot. Each change costs one appended line; compact()
+    # rewrites the snapshot and starts a fresh journal.
+    def __init__(self, path=JOURNAL_FILE, snapshot_path=PERSISTENCE_FILE):
+        self.path = path
+        self.snapshot_path = snapshot_path
+        self.events = 0
+        self.synced = False  # Set once the registry holds snapshot + journal; compacting earlier would drop jobs
+        self._file = None
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            # Events left by the previous run are compacted too, once load_job_state has replayed them
+            with open(path, "rb") as f:
+                self.events = sum(1 for _ in f)
+
+    def record(self, op, list_name=None, job=None, **fields):
+        event = {"op": op, "at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+        if list_name:
+            event["list"] = list_name
+        if job is not None:
+            event["job"] = serialize_job(job)
+        event.update(fields)
+        line = json.dumps(event, separators=(",", ":")) + "\n"
+
+        with self._lock:
+            try:
+                if self._file is None:
+                    self._file = open(self.path, "a", encoding="utf-8")
+                    if self._file.tell() and not self._ends_with_newline():
+                        self._file.write("\n")  # Fence off a line torn by a crash
+                self._file.write(line)
+                self._file.flush()
+                self.events += 1
+            except Exception as e:
+                print(f"[JOURNAL ERROR] Could not record {op}: {e}")
+
+    def _ends_with_newline(self):
+        with open(self.path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def load(self):
+        data = {name: [] for name in JOB_LISTS}
+        data["sent_log"] = []
+        data["templates"] = {}
+        data["dead_letters"] = []
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, "r") as f:
+                data.update(json.load(f))
+
+        state = {name: {} for name in JOB_LISTS}
+        for name in JOB_LISTS:
+            for job in data[name]:
+                job.setdefault("job_id", new_job_id(job["ticket"]))
+                state[name][job["job_id"]] = job
+        sent = deque(data["sent_log"], maxlen=SENT_LOG_MEMORY)
+        template_data = dict(data["templates"])
+        dead = {entry["id"]: entry for entry in data["dead_letters"]}
+
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        print("[JOURNAL] Skipping torn journal line.")
+                        continue
+                    self._apply(event, state, sent, template_data, dead)
+
+        result = {name: list(state[name].values()) for name in JOB_LISTS}
+        result["sent_log"] = list(sent)
+        result["templates"] = template_data
+        result["dead_letters"] = list(dead.values())
+        return result
+
+    @staticmethod
+    def _apply(event, state, sent, template_data, dead):
+        op = event.get("op")
+        if op in ("add", "edit"):
+            job = event["job"]
+            target = state[event["list"]]
+            if job["job_id"] not in target:
+                for jobs in state.values():
+                    jobs.pop(job["job_id"], None)
+            target[job["job_id"]] = job
+        elif op == "delete":
+            for jobs in state.values():
+                jobs.pop(event["job_id"], None)
+        elif op == "clear":
+            state[event["list"]].clear()
+        elif op == "sent":
+            sent.append(event["text"])
+        elif op == "template":
+            template_data[event["template_id"]] = {"raw": event["raw"], "html": event.get("html")}
+        elif op == "dead":
+            dead[event["entry"]["id"]] = event["entry"]
+        elif op == "dismiss":
+            dead.pop(event["dead_id"], None)
+
+    def compact(self, snapshot):
+        # snapshot() is taken under the journal lock, so no event can be recorded between
+        # the snapshot and the truncate. It must not call record() itself.
+        if not self.synced:
+            print("[JOURNAL] Saved jobs not loaded yet; not compacting.")
+            return
+        with self._lock:
+            write_json_atomic(self.snapshot_path, snapshot())
+            # Replaying events onto the new snapshot is harmless, so a crash here is safe
+            if self._file is not None:
+                self._file.close()
+            self._file = open(self.path, "w", encoding="utf-8")
+            self.events = 0
+
+
+journal = JobJournal()
+
+
+# --- Message templates ---
+PLACEHOLDER_RE = re.compile(r"\{\{\s*(\w+)\s*\}\}")
+PROTECTED_PLACEHOLDER_RE = re.compile("\x00(\\d+)\x00")
+
+
+def render_template_html(raw):
+    # Placeholders are swapped out while formatting, so "_" in a name can't turn into italics
+    names = []
+
+    def protect(match):
+        names.append(match.group(1))
+        return f"\x00{len(names) - 1}\x00"
+
+    formatted = format_message_with_html(PLACEHOLDER_RE.sub(protect, raw))
+    return PROTECTED_PLACEHOLDER_RE.sub(lambda m: "{{" + names[int(m.group(1))] + "}}", formatted)
+
+
+class TemplateStore:
+    # Message texts keyed by a hash of their content. Each is formatted to HTML once and
+    # split around its {{placeholders}}, so jobs only carry the template ID and a send
+    # just joins strings. New templates are journaled; snapshots keep the ones in use.
+    def __init__(self):
+        self._raw = {}
+        self._html = {}  # Only for templates that came from pre-rendered HTML
+        self._parts = {}
+        self._lock = threading.Lock()
+
+    def add(self, raw, rendered_html=None):
+        key = raw if rendered_html is None else "html:" + rendered_html
+        template_id = hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+        with self._lock:
+            if template_id in self._raw:
+                return template_id
+            self._store(template_id, raw, rendered_html)
+        journal.record("template", template_id=template_id, raw=raw, html=rendered_html)
+        return template_id
+
+    def load(self, entries):
+        with self._lock:
+            for template_id, entry in entries.items():
+                if template_id not in self._raw:
+                    self._store(template_id, entry["raw"], entry.get("html"))
+
+    def raw(self, template_id):
+        return self._raw.get(template_id, "")
+
+    def placeholders(self, template_id):
+        return set(self._parts.get(template_id, ())[1::2])
+
+    def render(self, template_id, variables):
+        parts = self._parts.get(template_id)
+        if parts is None:
+            raise KeyError(f"Unknown message template {template_id}")
+        out = [parts[0]]
+        for i in range(1, len(parts), 2):
+            name = parts[i]
+            value = variables.get(name)
+            out.append("{{" + name + "}}" if value is None else html.escape(str(value)))
+            out.append(parts[i + 1])
+        return "".join(out)
+
+    def export(self, template_ids):
+        return {
+            template_id: {"raw": self._raw[template_id], "html": self._html.get(template_id)}
+            for template_id in template_ids
+            if template_id in self._raw
+        }
+
+    def _store(self, template_id, raw, rendered_html):
+        self._raw[template_id] = raw
+        if rendered_html is not None:
+            self._html[template_id] = rendered_html
+        self._parts[template_id] = PLACEHOLDER_RE.split(
+            rendered_html if rendered_html is not None else render_template_html(raw)
+        )
+
+
+templates = TemplateStore()
+
+
+def snapshot_jobs():
+    data = {name: [serialize_job(job) for job in registry.jobs(state)] for state, name in JOB_STATES.items()}
+    data["sent_log"] = list(sent_log)
+    data["dead_letters"] = retry_queue.dead_letters()
+    # Dead letters of unrenderable jobs refer to their template too; keep it for a requeue
+    template_ids = {job["template_id"] for name in JOB_LISTS for job in data[name]}
+    template_ids.update(entry["template_id"] for entry in data["dead_letters"] if entry.get("template_id"))
+    data["templates"] = templates.export(template_ids)
+    return data
+
+
+def compact_journal_if_needed():
+    if journal.events >= JOURNAL_COMPACT_EVENTS:
+        try:
+            journal.compact(snapshot_jobs)
+            print("[JOURNAL] Compacted into snapshot.")
+        except Exception as e:
+            print(f"[JOURNAL ERROR] Compaction failed: {e}")
+
+
+def has_saved_jobs():
+    return os.path.exists(PERSISTENCE_FILE) or os.path.exists(JOURNAL_FILE)
+
+
+def load_job_state(stored_ids=()):
+    # Replace the in-memory jobs with snapshot + journal and schedule the future ones,
+    # except those in stored_ids: the job store already holds them
+    data = journal.load()
+
+    registry.clear()
+    sent_log.clear()
+    sent_log.extend(data["sent_log"])
+    templates.load(data["templates"])
+    retry_queue.load(data["dead_letters"])
+
+    for state, name in JOB_STATES.items():
+        for job_data in data.get(name, []):
+            try:
+                job = registry.add(JobRecord.from_dict(job_data, state))
+            except Exception as e:
+                print(f"[ERROR] Failed to load {state} job for ticket {job_data.get('ticket', '???')}: {e}")
+                continue
+
+            if job.time is not None and state != "queue" and job.time > datetime.now() and job.job_id not in stored_ids:
+                schedule_send(job)
+
+    journal.synced = True
+    print("[LOAD] Job data restored.")
+
+
+# Same passes as the old [text](url), **bold** and _italic_ regexes, in the same order,
+# but each is a single left-to-right str.find scan, so no input can make them backtrack
+def convert_links(text):
+    out = []
+    start = pos = 0
+    close_paren = -1  # First ")" at or after the last lookup; reused while still ahead
+    while True:
+        i = text.find("[", pos)
+        if i == -1:
+            break
+        j = text.find("]", i + 1)
+        if j == -1:
+            break
+        pos = j + 1
+        if j == i + 1:
+            continue
+
+        k = j + 1
+        while k < len(text) and text[k].isspace():
+            k += 1
+        if not text.startswith("(", k):
+            continue
+        if text.startswith("https://", k + 1):
+            url_start = k + 9
+        elif text.startswith("http://", k + 1):
+            url_start = k + 8
+        else:
+            continue
+
+        if close_paren < url_start:
+            close_paren = text.find(")", url_start)
+            if close_paren == -1:
+                break
+        if close_paren == url_start:
+            continue
+
+        out.append(text[start:i])
+        out.append(f'<a href="{text[k + 1:close_paren]}">{text[i + 1:j]}</a>')
+        start = pos = close_paren + 1
+
+    out.append(text[start:])
+    return "".join(out)
+
+
+def wrap_marked(text, marker, tag, single_line=False):
+    out = []
+    start = pos = 0
+    while True:
+        i = text.find(marker, pos)
+        if i == -1:
+            break
+        j = text.find(marker, i + len(marker))
+        if j == -1:
+            break
+        if single_line and text.find("\n", i, j) != -1:
+            pos = j
+            continue
+
+        out.append(text[start:i])
+        out.append(f"<{tag}>{text[i + len(marker):j]}</{tag}>")
+        start = pos = j + len(marker)
+
+    out.append(text[start:])
+    return "".join(out)
+
+
+def convert_formatting(text):
+    text = convert_links(text)
+    text = wrap_marked(text, "**", "b")
+    text = wrap_marked(text, "_", "i", single_line=True)
+    return text
+
+
+@functools.lru_cache(maxsize=FORMAT_CACHE_SIZE)
+def format_message_with_html(text):
+    lines = text.splitlines()
+    html_lines = []
+    in_list = False
+    for line in lines:
+        stripped = line.strip()
+        if not stripped:
+            continue
+        formatted = convert_formatting(stripped)
+        if stripped.startswith(("-", "•")):
+            if not in_list:
+                html_lines.append("<ul>")
+                in_list = True
+            html_lines.append(f"<li>{formatted[1:].strip()}</li>")
+        else:
+            if in_list:
+                html_lines.append("</ul>")
+                in_list = False
+            html_lines.append(f"<p>{formatted}</p>")
+    if in_list:
+        html_lines.append("</ul>")
+    return "".join(html_lines)
+
+
+# --- Rate limit governor ---
+def parse_retry_after(value, default=60.0):
+    if not value:
+        return default
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+        return max((retry_at - datetime.now(retry_at.tzinfo)).total_seconds(), 0.0)
+    except (TypeError, ValueError):
+        return default
+
+
+class RateLimitGovernor:
+    # Token bucket in front of every Zendesk call. Callers over budget are queued
+    # (they sleep until their token is due) instead of failing; the limit follows
+    # X-Rate-Limit headers and a 429 Retry-After pauses everyone.
+    def __init__(self, limit_per_minute=ZENDESK_RATE_LIMIT):
+        self.limit = limit_per_minute
+        self.remaining_reported = None
+        self.throttled = 0
+        self.waiting = 0
+        self._tokens = float(limit_per_minute)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.limit, self._tokens + (now - self._updated) * self.limit / 60.0)
+        self._updated = now
+
+    def reserve(self):
+        # Takes a token and returns how long the caller must wait before using it
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= 1
+            wait = -self._tokens * 60.0 / self.limit if self._tokens < 0 else 0.0
+            return max(wait, self._paused_until - now)
+
+    def acquire(self):
+        wait = self.reserve()
+        if wait <= 0:
+            return
+        with self._lock:
+            self.waiting += 1
+        try:
+            time.sleep(wait)
+        finally:
+            with self._lock:
+                self.waiting -= 1
+
+    def update_from_headers(self, headers):
+        with self._lock:
+            try:
+                if "X-Rate-Limit" in headers:
+                    self.limit = max(int(headers["X-Rate-Limit"]), 1)
+                if "X-Rate-Limit-Remaining" in headers:
+                    self.remaining_reported = int(headers["X-Rate-Limit-Remaining"])
+                    self._refill(time.monotonic())
+                    self._tokens = min(self._tokens, self.remaining_reported)
+            except ValueError:
+                pass
+
+    def pause(self, seconds):
+        with self._lock:
+            self.throttled += 1
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = min(self._tokens, 0.0)
+
+    def usage(self):
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            return {
+                "limit": self.limit,
+                "available": max(int(self._tokens), 0),
+                "used": self.limit - max(int(self._tokens), 0),
+                "remaining_reported": self.remaining_reported,
+                "waiting": self.waiting,
+                "throttled": self.throttled,
+                "paused_for": max(self._paused_until - now, 0.0),
+            }
+
+
+zendesk_governor = RateLimitGovernor()
+
+
+# --- Zendesk HTTP Client ---
+class ZendeskClient:
+    # One pooled keep-alive session per account, safe to share between scheduler threads
+    def __init__(self, account, pool_size=ZENDESK_POOL_SIZE, governor=zendesk_governor):
+        self.account = account
+        self.governor = governor
+        self.session = requests.Session()
+        self.session.auth = (account.email, account.password)
+        self.session.headers.update(
+            {
+                "Content-Type": "application/json",
+                "Accept": "application/json",
+                "X-Requested-With": "XMLHttpRequest",
+                "User-Agent": REAL_USER_AGENT,
+            }
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def url(self, path):
+        if path.startswith(("https://", "http://")):
+            return path  # Pagination links come back absolute
+        return f"{self.account.base_url}/api/v2/{path}"
+
+    def request(self, method, path, **kwargs):
+        kwargs.setdefault("timeout", ZENDESK_TIMEOUT)
+        for attempt in range(RATE_LIMIT_MAX_RETRIES + 1):
+            self.governor.acquire()
+            start = time.perf_counter()
+            try:
+                response = self.session.request(method, self.url(path), **kwargs)
+            except Exception:
+                record_zendesk_call(self.account.name, method, path, "error", time.perf_counter() - start)
+                raise
+            record_zendesk_call(self.account.name, method, path, response.status_code, time.perf_counter() - start)
+            self.governor.update_from_headers(response.headers)
+            if response.status_code != 429 or attempt == RATE_LIMIT_MAX_RETRIES:
+                return response
+
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            print(f"[RATE LIMIT] 429 on {path}, queueing for {retry_after:.0f}s")
+            self.governor.pause(retry_after)
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def put(self, path, **kwargs):
+        return self.request("PUT", path, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+# --- Zendesk accounts ---
+@dataclass(slots=True)
+class Account:
+    name: str
+    subdomain: str = ""  # "brand" for https://brand.zendesk.com, or a full base URL
+    email: str = ""
+    password: str = ""
+
+    @property
+    def base_url(self):
+        if self.subdomain.startswith(("https://", "http://")):
+            return self.subdomain.rstrip("/")
+        return f"https://{self.subdomain}.zendesk.com"
+
+    def ready(self):
+        return bool(self.subdomain and self.email and self.password)
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class AccountRegistry:
+    # The Zendesk instances jobs can go to. Each account gets its own pooled client and
+    # its own rate-limit governor, so sends to one brand never queue behind another's
+    # budget. Accounts are replaced, not mutated, so in-flight sends keep a stable copy.
+    def __init__(self):
+        self._accounts = {DEFAULT_ACCOUNT: Account(DEFAULT_ACCOUNT, ZENDESK_BASE_URL)}
+        self._governors = {DEFAULT_ACCOUNT: zendesk_governor}
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def get(self, name=None):
+        return self._accounts.get(name or DEFAULT_ACCOUNT)
+
+    def names(self):
+        return list(self._accounts)
+
+    def set(self, name, **fields):
+        with self._lock:
+            current = self._accounts.get(name) or Account(name)
+            account = Account(**{**current.to_dict(), **fields, "name": name})
+            self._accounts[name] = account
+            self._governors.setdefault(name, RateLimitGovernor())
+            # New connection details get a fresh session; the old pool is closed, not leaked
+            stale = None
+            if (account.base_url, account.email, account.password) != (current.base_url, current.email, current.password):
+                stale = self._clients.pop(name, None)
+        if stale is not None:
+            stale.close()
+        return account
+
+    def governor(self, name):
+        with self._lock:
+            return self._governors.setdefault(name, RateLimitGovernor())
+
+    def client(self, account):
+        # One client per account, built from its current details (set() drops it when they change)
+        with self._lock:
+            client = self._clients.get(account.name)
+            if client is None:
+                current = self._accounts.get(account.name, account)
+                client = ZendeskClient(current, governor=self._governors.setdefault(account.name, RateLimitGovernor()))
+                self._clients[account.name] = client
+            return client
+
+
+accounts = AccountRegistry()
+
+
+def get_zendesk_client(account):
+    return accounts.client(account)
+
+
+def load_accounts_file(path=ACCOUNTS_FILE):
+    try:
+        with open(path, "r") as f:
+            config = json.load(f)
+    except FileNotFoundError:
+        return accounts.names()
+    except Exception as e:
+        print(f"[ERROR] Could not load Zendesk accounts: {e}")
+        return accounts.names()
+
+    for name, fields in config.items():
+        accounts.set(name, **{key: fields[key] for key in ("subdomain", "email", "password") if key in fields})
+    print(f"[ACCOUNTS] Loaded {len(config)} account(s) from {path}.")
+    return accounts.names()
+
+
+# --- Zendesk API Calls ---
+def fetch_recent_comments(account, ticket_id, count=1):
+    # Newest first with a small cursor page, so only the comments asked for are downloaded;
+    # None when the fetch failed
+    client = get_zendesk_client(account)
+    response = client.get(
+        f"tickets/{ticket_id}/comments.json",
+        params={"sort": "-created_at", "page[size]": count},
+    )
+    if response.status_code == 200:
+        return response.json().get("comments", [])
+    print(f"[ERROR] Comment fetch for ticket {ticket_id} failed: {response.status_code}")
+    return None
+
+
+def fetch_latest_comment(account, ticket_id):
+    comments = fetch_recent_comments(account, ticket_id)
+    return comments[0] if comments else None
+
+
+def fetch_requester_name(account, ticket_id):
+    client = get_zendesk_client(account)
+    try:
+        response = client.get(f"tickets/{ticket_id}.json", params={"include": "users"})
+        if response.status_code == 200:
+            data = response.json()
+            requester_id = data.get("ticket", {}).get("requester_id")
+            for user in data.get("users", []):
+                if user.get("id") == requester_id and user.get("name"):
+                    return user["name"]
+        else:
+            print(f"[ERROR] Requester lookup for ticket {ticket_id} failed: {response.status_code}")
+    except Exception as e:
+        print(f"[ERROR] Requester lookup for ticket {ticket_id} failed: {e}")
+    return REQUESTER_NAME_FALLBACK
+
+
+def render_job_message(job, account):
+    # Fills the job's template; the requester is only looked up when the template asks for it
+    variables = job.template_variables()
+    if "requester_name" not in variables and "requester_name" in templates.placeholders(job.template_id):
+        variables["requester_name"] = fetch_requester_name(account, job.ticket)
+    return templates.render(job.template_id, variables)
+
+
+def get_last_comment(account, ticket_id):
+    try:
+        last_comment = fetch_latest_comment(account, ticket_id)
+        if last_comment:
+            return clean_html(
+                last_comment.get("html_body") or last_comment.get("body")
+            )
+    except Exception as e:
+        print(f"[ERROR] Could not fetch last comment for ticket {ticket_id}: {e}")
+    return ""
+
+
+# --- Last comment fingerprints ---
+def comment_fingerprint(comment):
+    if not comment:
+        return ""
+    return f"{comment.get('id')}@{comment.get('created_at', '')}"
+
+
+def text_fingerprint(text):
+    # Only used for jobs saved before fingerprints, which stored the cleaned comment text
+    normalized = " ".join(text.split())
+    return "text:" + hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+
+def get_last_comment_fingerprint(account, ticket_id, legacy=False):
+    try:
+        last_comment = fetch_latest_comment(account, ticket_id)
+        if legacy:
+            text = clean_html(last_comment.get("html_body") or last_comment.get("body")) if last_comment else ""
+            return text_fingerprint(text)
+        return comment_fingerprint(last_comment)
+    except Exception as e:
+        print(f"[ERROR] Could not fetch last comment for ticket {ticket_id}: {e}")
+    return None
+
+
+def upgrade_legacy_job(job):
+    last_comment = job.pop("last_comment", None)
+    if "last_comment_fp" not in job:
+        job["last_comment_fp"] = text_fingerprint(last_comment) if last_comment else ""
+    return job
+
+
+def build_ticket_update(message, solve_ticket, public_reply, plain_text=False):
+    # ✨ Default values
+    return {
+        "comment": {
+            "body" if plain_text else "html_body": message,
+            "public": public_reply,
+        },
+        "status": "solved" if solve_ticket else "open",
+        "priority": "normal",
+        "type": "incident",
+        "custom_fields": [
+            {"id": 360004384577, "value": "software"}  # Example field ID
+        ],
+    }
+
+
+# --- Sent history archive ---
+class SentArchive:
+    # Every send is appended to a per-day JSON Lines file, so sent_log only has to hold
+    # the recent ones. Searches open just the days in range and stream them line by line.
+    def __init__(self, directory=SENT_ARCHIVE_DIR, keep_days=SENT_ARCHIVE_DAYS):
+        self.directory = directory
+        self.keep_days = keep_days
+        self._file = None
+        self._day = None
+        self._lock = threading.Lock()
+
+    def path_for(self, day):
+        return os.path.join(self.directory, f"sent-{day.isoformat()}.jsonl")
+
+    def append(self, entry):
+        line = json.dumps(entry, separators=(",", ":"), ensure_ascii=False) + "\n"
+        today = datetime.now().date()
+        with self._lock:
+            try:
+                if self._day != today:
+                    self._rotate(today)
+                self._file.write(line)
+                self._file.flush()
+            except Exception as e:
+                print(f"[ARCHIVE ERROR] Could not archive send for ticket #{entry.get('ticket')}: {e}")
+
+    def search(self, ticket=None, start=None, end=None, limit=1000, account=None):
+        # Newest first; start/end are dates (inclusive), defaulting to the retention window.
+        # Ticket numbers repeat across Zendesk instances, so account narrows to one of them.
+        end = end or datetime.now().date()
+        start = start or end - timedelta(days=self.keep_days)
+        ticket = str(ticket) if ticket else None
+        results = []
+        day = end
+        while day >= start and len(results) < limit:
+            path = self.path_for(day)
+            if os.path.exists(path):
+                matches = []
+                with open(path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        try:
+                            entry = json.loads(line)
+                        except ValueError:
+                            continue
+                        if ticket is not None and entry.get("ticket") != ticket:
+                            continue
+                        if account is not None and entry.get("account", DEFAULT_ACCOUNT) != account:
+                            continue
+                        matches.append(entry)
+                results.extend(reversed(matches))
+            day -= timedelta(days=1)
+        return results[:limit]
+
+    def _rotate(self, today):
+        os.makedirs(self.directory, exist_ok=True)
+        if self._file is not None:
+            self._file.close()
+        self._file = open(self.path_for(today), "a", encoding="utf-8")
+        self._day = today
+
+        cutoff = self.path_for(today - timedelta(days=self.keep_days))
+        for path in glob.glob(os.path.join(self.directory, "sent-*.jsonl")):
+            if path < cutoff:  # ISO dates sort like the days they name
+                os.remove(path)
+
+
+sent_archive = SentArchive()
+
+
+def ticket_label(ticket_id, account_name):
+    # Tickets of the default account keep their bare number, as before accounts existed
+    return str(ticket_id) if account_name == DEFAULT_ACCOUNT else f"{ticket_id} @ {account_name}"
+
+
+def log_sent_ticket(account, ticket_id, solve_ticket, public_reply, now_time, plain_text=False):
+    label = ticket_label(ticket_id, account.name)
+    log_text = f"✅ {now_time} → Ticket: {label} | Solved: {'Yes' if solve_ticket else 'No'}"
+    if plain_text:
+        log_text += " (plain text)"
+    print(f"[SUCCESS] {log_text}")
+    metrics.inc("sends_total", outcome="sent")
+    sent_log.append(log_text)
+    journal.record("sent", ticket=str(ticket_id), account=account.name, text=log_text)
+    sent_archive.append(
+        {
+            "at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "account": account.name,
+            "ticket": str(ticket_id),
+            "solved": solve_ticket,
+            "public": public_reply,
+            "plain_text": plain_text,
+            "text": log_text,
+        }
+    )
+    for listener in sent_listeners:
+        listener(log_text)
+
+    if plain_text:
+        return
+
+    # 🔔 Telegram update, delivered in the background by the notifier
+    if telegram_settings["token"] and telegram_settings["chat_id"]:
+        status_text = "Solved ✅" if solve_ticket else "Open 🟡"
+        reply_type = "Public Email 📤" if public_reply else "Internal Note 🛡️"
+        telegram_msg = f"🎫 Ticket #{label} | {status_text} | {reply_type} | Sent at {now_time}"
+        telegram_notifier.notify(telegram_msg)
+
+
+def prefetch_fingerprints(account, ticket_ids, max_workers=PREFETCH_WORKERS):
+    # Returns (fingerprints, failed ticket IDs). A failed fetch has no fingerprint that
+    # could ever match, so those tickets must not be queued with check_last on.
+    unique_ids = list(dict.fromkeys(ticket_ids))
+    if not unique_ids:
+        return {}, []
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(unique_ids))) as pool:
+        results = dict(zip(unique_ids, pool.map(lambda ticket_id: get_last_comment_fingerprint(account, ticket_id), unique_ids)))
+    failed = [ticket_id for ticket_id, fingerprint in results.items() if fingerprint is None]
+    if failed:
+        print(f"[ERROR] Last comment fetch failed for {len(failed)} ticket(s): {', '.join(failed)}")
+    return {ticket_id: fingerprint for ticket_id, fingerprint in results.items() if fingerprint is not None}, failed
+
+
+def parse_ticket_ids(text):
+    return [ticket for ticket in re.split(r"[\s,;]+", text) if ticket]
+
+
+# --- Bulk import ---
+def read_ticket_csv(path):
+    # Yields (ticket_id, variables). A header row names the ID column (ticket_id, id or
+    # ticket, else the first); its other columns become template variables.
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        rows = csv.reader(f)
+        first = next(rows, None)
+        if first is None:
+            return
+        if first and first[0].strip().isdigit():
+            header = None
+            rows = itertools.chain([first], rows)
+            id_column = 0
+        else:
+            header = [name.strip() for name in first]
+            lowered = [name.lower() for name in header]
+            id_column = next((lowered.index(name) for name in ("ticket_id", "id", "ticket") if name in lowered), 0)
+
+        for row in rows:
+            if len(row) <= id_column or not row[id_column].strip():
+                continue
+            variables = {}
+            if header:
+                variables = {
+                    name: value.strip()
+                    for i, (name, value) in enumerate(zip(header, row))
+                    if i != id_column and name and value.strip()
+                }
+            yield row[id_column].strip(), variables
+
+
+def iter_cursor_pages(client, path, params, key):
+    # Follows Zendesk cursor pagination (links.next while meta.has_more)
+    while path:
+        response = client.get(path, params=params)
+        if response.status_code != 200:
+            raise RuntimeError(f"{path} failed: {response.status_code} {response.text[:200]}")
+        data = response.json()
+        yield from data.get(key, [])
+        path = data.get("links", {}).get("next") if data.get("meta", {}).get("has_more") else None
+        params = None  # The next link already carries the cursor and filters
+
+
+def search_ticket_ids(account, query):
+    client = get_zendesk_client(account)
+    params = {"query": query, "filter[type]": "ticket", "page[size]": SEARCH_PAGE_SIZE}
+    for ticket in iter_cursor_pages(client, "search/export.json", params, "results"):
+        yield str(ticket["id"]), {}
+
+
+def view_ticket_ids(account, view_id):
+    client = get_zendesk_client(account)
+    params = {"page[size]": VIEW_PAGE_SIZE}
+    for ticket in iter_cursor_pages(client, f"views/{view_id}/tickets.json", params, "tickets"):
+        yield str(ticket["id"]), {}
+
+
+def import_tickets(account, tickets, template_id, check_last, solve_ticket, public_reply, on_progress=None):
+    # Streams (ticket_id, variables) pairs into the queue chunk by chunk, prefetching the
+    # fingerprints of each chunk in parallel. Tickets already queued are skipped; tickets
+    # whose last comment couldn't be fetched are left out and returned as failed.
+    tickets = iter(tickets)
+    imported = []
+    failed = []
+    skipped = 0
+    for chunk in iter(lambda: list(itertools.islice(tickets, IMPORT_CHUNK_SIZE)), []):
+        fresh = {}
+        for ticket, variables in chunk:
+            if ticket in fresh or any(
+                job.state == "queue" and job.account == account.name for job in registry.for_ticket(ticket)
+            ):
+                skipped += 1
+                continue
+            fresh[ticket] = variables
+
+        fingerprints, chunk_failed = prefetch_fingerprints(account, list(fresh)) if check_last else ({}, [])
+        failed.extend(chunk_failed)
+        for ticket, variables in fresh.items():
+            if ticket in chunk_failed:
+                continue
+            job = JobRecord(
+                job_id=new_job_id(ticket),
+                ticket=ticket,
+                template_id=template_id,
+                variables=variables or None,
+                last_comment_fp=fingerprints.get(ticket, ""),
+                check_last=check_last,
+                solve_ticket=solve_ticket,
+                public_reply=public_reply,
+                account=account.name,
+            )
+            registry.add(job)
+            journal.record("add", "job_queue", job)
+            imported.append(job)
+
+        if on_progress:
+            on_progress(len(imported), skipped, len(failed))
+
+    print(f"[IMPORT] Queued {len(imported)} tickets, skipped {skipped} already queued, {len(failed)} failed.")
+    return imported, failed
+
+
+def send_message(
+    account,
+    ticket_id,
+    message,
+    solve_ticket,
+    public_reply,
+    check_last=False,
+    original_fingerprint="",
+    attempt=1,
+):
+    client = get_zendesk_client(account)
+    path = f"tickets/{ticket_id}.json"
+    payload = {"ticket": build_ticket_update(message, solve_ticket, public_reply)}
+
+    def failed(error, status=None):
+        retry_queue.failed(
+            account, ticket_id, message, solve_ticket, public_reply, error, status,
+            attempt, check_last, original_fingerprint,
+        )
+
+    try:
+        response = client.put(path, data=json.dumps(payload))
+        now_time = datetime.now().strftime("%H:%M:%S")
+
+        if response.status_code == 200:
+            log_sent_ticket(account, ticket_id, solve_ticket, public_reply, now_time)
+        else:
+            print(f"[ERROR] Failed to update ticket #{ticket_id}: {response.status_code}")
+            print(f"[DETAILS] {response.text}")
+
+            if response.status_code == 422:
+                print("[INFO] Retrying with plain text body...")
+                metrics.inc("zendesk_plain_text_retries_total")
+                payload["ticket"] = build_ticket_update(message, solve_ticket, public_reply, plain_text=True)
+
+                retry_response = client.put(path, data=json.dumps(payload))
+                if retry_response.status_code == 200:
+                    log_sent_ticket(account, ticket_id, solve_ticket, public_reply, now_time, plain_text=True)
+                else:
+                    print(f"[RETRY ERROR] {retry_response.status_code}: {retry_response.text}")
+                    failed(f"HTTP {retry_response.status_code}", retry_response.status_code)
+            else:
+                failed(f"HTTP {response.status_code}", response.status_code)
+
+    except Exception as e:
+        print(f"[EXCEPTION] Error while sending to ticket #{ticket_id}: {str(e)}")
+        failed(str(e))
+
+
+# --- Retry queue ---
+def reply_text_fingerprint(html_or_text):
+    return text_fingerprint(clean_html(html_or_text or ""))
+
+
+class RetryQueue:
+    # Failed sends are retried on an exponential backoff through the scheduler (so
+    # pending retries survive restarts in the job store). Before each retry the newest
+    # comments are checked for our reply, so a send that actually landed is never
+    # posted twice. Sends that run out of attempts or fail permanently become dead
+    # letters: journaled, kept in the snapshot and listed in the app.
+    def __init__(self, max_attempts=SEND_MAX_ATTEMPTS):
+        self.max_attempts = max_attempts
+        self.listeners = []  # Called after the dead-letter list changes, possibly from a worker thread
+        self._dead = {}
+        self._lock = threading.Lock()
+
+    def failed(
+        self,
+        account,
+        ticket_id,
+        message,
+        solve_ticket,
+        public_reply,
+        error,
+        status=None,
+        attempt=1,
+        check_last=False,
+        original_fingerprint="",
+    ):
+        entry = {
+            "id": uuid.uuid4().hex[:12],
+            "account": account.name,
+            "ticket": str(ticket_id),
+            "message": message,
+            "solve_ticket": solve_ticket,
+            "public_reply": public_reply,
+            "check_last": check_last,
+            "original_fp": original_fingerprint or "",
+            "attempt": attempt,
+            "error": error,
+            "at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        metrics.inc("sends_total", outcome="failed")
+        if status in PERMANENT_FAILURES or attempt >= self.max_attempts:
+            self._bury(entry)
+            return
+
+        delay = min(RETRY_BASE_SECONDS * 2 ** (attempt - 1), RETRY_MAX_SECONDS)
+        print(f"[RETRY] Ticket #{ticket_id} failed ({error}); attempt {attempt + 1}/{self.max_attempts} in {delay}s")
+        self._schedule(entry, datetime.now() + timedelta(seconds=delay))
+
+    def bury_job(self, job, error):
+        # For jobs that could not even be rendered: keep the template reference so a
+        # requeue renders them once the template (or account) is available again. The
+        # template itself rides along, since the job holding it may be deleted and the
+        # scheduled retry outlives snapshots
+        self._bury(
+            {
+                "id": uuid.uuid4().hex[:12],
+                "account": job.account,
+                "ticket": str(job.ticket),
+                "message": "",
+                "template_id": job.template_id,
+                "template": templates.export({job.template_id}).get(job.template_id),
+                "variables": job.variables,
+                "solve_ticket": job.solve_ticket,
+                "public_reply": job.public_reply,
+                "check_last": job.check_last,
+                "original_fp": job.last_comment_fp or "",
+                "attempt": 0,
+                "error": error,
+                "at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            }
+        )
+
+    def retry(self, entry):
+        account = accounts.get(entry.get("account"))
+        if account is None:
+            self._bury(dict(entry, error=f"unknown account {entry['account']!r}"))
+            return
+        if not account.ready():
+            self._schedule(entry, datetime.now() + timedelta(seconds=CREDENTIALS_WAIT_SECONDS))
+            return
+        if entry.get("template_id"):
+            if entry.get("template"):
+                templates.load({entry["template_id"]: entry["template"]})
+            job = JobRecord(new_job_id(entry["ticket"]), entry["ticket"], entry["template_id"], entry.get("variables"))
+            try:
+                entry = dict(entry, message=render_job_message(job, account), template_id=None, template=None)
+            except KeyError as e:
+                self._bury(dict(entry, error=str(e)))
+                return
+
+        ticket_id = entry["ticket"]
+        next_attempt = entry["attempt"] + 1
+        try:
+            recent = fetch_recent_comments(account, ticket_id, RETRY_IDEMPOTENCY_COMMENTS)
+        except Exception as e:
+            recent = None
+            print(f"[ERROR] Could not check ticket #{ticket_id} before retrying: {e}")
+        if recent is None:
+            self.failed(
+                account, ticket_id, entry["message"], entry["solve_ticket"], entry["public_reply"],
+                "comment check failed", None, next_attempt, entry["check_last"], entry["original_fp"],
+            )
+            return
+
+        ours = reply_text_fingerprint(entry["message"])
+        if any(reply_text_fingerprint(c.get("html_body") or c.get("body")) == ours for c in recent):
+            print(f"[RETRY] Ticket #{ticket_id} already has this reply; not posting it again.")
+            metrics.inc("sends_total", outcome="retry_already_sent")
+            log_sent_ticket(account, ticket_id, entry["solve_ticket"], entry["public_reply"], datetime.now().strftime("%H:%M:%S"))
+            return
+
+        if entry["check_last"]:
+            newest = recent[0] if recent else None
+            if entry["original_fp"].startswith("text:"):
+                current = reply_text_fingerprint(newest.get("html_body") or newest.get("body")) if newest else text_fingerprint("")
+            else:
+                current = comment_fingerprint(newest)
+            if current != entry["original_fp"]:
+                print(f"[SKIPPED] Ticket #{ticket_id} changed since scheduling. Not retrying.")
+                metrics.inc("sends_total", outcome="skipped_changed")
+                return
+
+        print(f"[RETRY] Ticket #{ticket_id}, attempt {next_attempt}/{self.max_attempts}")
+        metrics.inc("sends_total", outcome="retried")
+        send_message(
+            account, ticket_id, entry["message"], entry["solve_ticket"], entry["public_reply"],
+            entry["check_last"], entry["original_fp"], next_attempt,
+        )
+
+    def requeue(self, dead_id):
+        # Manual retry from the dead-letter list, with a fresh set of attempts
+        with self._lock:
+            entry = self._dead.pop(dead_id, None)
+        if entry is None:
+            return
+        journal.record("dismiss", dead_id=dead_id)
+        self._notify()
+        self._schedule(dict(entry, attempt=0), datetime.now())
+
+    def dismiss(self, dead_id):
+        with self._lock:
+            found = self._dead.pop(dead_id, None) is not None
+        if found:
+            journal.record("dismiss", dead_id=dead_id)
+            self._notify()
+
+    def dead_letters(self):
+        with self._lock:
+            return list(self._dead.values())
+
+    def load(self, entries):
+        with self._lock:
+            self._dead = {entry["id"]: entry for entry in entries}
+        self._notify()
+
+    def _schedule(self, entry, run_date):
+        scheduler.add_job(
+            run_retry,
+            "date",
+            run_date=run_date,
+            args=[entry],
+            id=f"retry_{entry['id']}",
+            executor=SEND_EXECUTOR,
+            replace_existing=True,
+        )
+
+    def _bury(self, entry):
+        print(f"[DEAD LETTER] Ticket #{entry['ticket']} gave up after {entry['attempt']} attempt(s): {entry['error']}")
+        metrics.inc("sends_total", outcome="dead_letter")
+        with self._lock:
+            self._dead[entry["id"]] = entry
+        journal.record("dead", entry=entry)
+        self._notify()
+
+    def _notify(self):
+        for listener in self.listeners:
+            listener()
+
+
+retry_queue = RetryQueue()
+
+
+def run_retry(entry):
+    retry_queue.retry(entry)
+
+
+# --- Bulk Ticket Updates ---
+def wait_for_job_status(client, job_status):
+    deadline = time.monotonic() + JOB_STATUS_TIMEOUT
+    while job_status.get("status") not in ("completed", "failed", "killed"):
+        if time.monotonic() > deadline:
+            print(f"[BULK] Gave up waiting for job status {job_status.get('id')}")
+            break
+        time.sleep(JOB_STATUS_POLL_SECONDS)
+        response = client.get(f"job_statuses/{job_status['id']}.json")
+        if response.status_code == 200:
+            job_status = response.json().get("job_status", job_status)
+        else:
+            print(f"[BULK ERROR] Job status poll failed: {response.status_code}")
+    return job_status
+
+
+def send_bulk_update(account, tickets, solve_ticket, public_reply):
+    # tickets: (ticket_id, message, check_last, original_fingerprint) tuples, at most one
+    # per ticket ID, since results come back by ticket (see split_bulk_batches)
+    client = get_zendesk_client(account)
+    sends = {ticket[0]: ticket for ticket in tickets}
+    payload = {
+        "tickets": [
+            {"id": int(ticket_id), **build_ticket_update(message, solve_ticket, public_reply)}
+            for ticket_id, message, _, _ in tickets
+        ]
+    }
+
+    def send_one(ticket_id):
+        _, message, check_last, original_fingerprint = sends[ticket_id]
+        send_message(account, ticket_id, message, solve_ticket, public_reply, check_last, original_fingerprint)
+
+    def failed(ticket_id, error):
+        # The retry checks recent comments first, so a ticket that did get the reply isn't posted twice
+        _, message, check_last, original_fingerprint = sends[ticket_id]
+        retry_queue.failed(
+            account, ticket_id, message, solve_ticket, public_reply, error, None, 1, check_last, original_fingerprint,
+        )
+
+    try:
+        response = client.put("tickets/update_many.json", data=json.dumps(payload))
+    except Exception as e:
+        print(f"[BULK EXCEPTION] update_many failed, sending one by one: {e}")
+        response = None
+
+    if response is None or response.status_code != 200:
+        if response is not None:
+            print(f"[BULK ERROR] update_many failed: {response.status_code}")
+            print(f"[DETAILS] {response.text}")
+        for ticket_id in sends:
+            send_one(ticket_id)
+        return
+
+    try:
+        job_status = wait_for_job_status(client, response.json().get("job_status", {}))
+    except Exception as e:
+        print(f"[BULK EXCEPTION] Could not track job status: {e}")
+        for ticket_id in sends:
+            failed(ticket_id, f"bulk job status unknown: {e}")
+        return
+
+    now_time = datetime.now().strftime("%H:%M:%S")
+    print(f"[BULK] Job {job_status.get('id')} finished: {job_status.get('status')}")
+    reported = set()
+    for result in job_status.get("results") or []:
+        ticket_id = str(result.get("id"))
+        if ticket_id not in sends:
+            continue
+        reported.add(ticket_id)
+        if result.get("success", "error" not in result):
+            log_sent_ticket(account, ticket_id, solve_ticket, public_reply, now_time)
+        else:
+            print(f"[BULK ERROR] Ticket #{ticket_id}: {result.get('error')} {result.get('details', '')}")
+            send_one(ticket_id)
+
+    # Failed/killed jobs and timeouts leave tickets without a result
+    for ticket_id in sends.keys() - reported:
+        print(f"[BULK WARN] No result reported for ticket #{ticket_id}; retrying it on its own.")
+        failed(ticket_id, f"bulk job {job_status.get('status') or 'unknown'}, no result")
+
+
+def split_bulk_batches(tickets, size=BULK_MAX_TICKETS):
+    # Batches of up to `size` with no ticket ID twice. A second message for a ticket goes
+    # into a later batch, so both are sent, in the order they came due
+    batches = []
+    while tickets:
+        batch, seen, rest = [], set(), []
+        for ticket in tickets:
+            if len(batch) < size and ticket[0] not in seen:
+                seen.add(ticket[0])
+                batch.append(ticket)
+            else:
+                rest.append(ticket)
+        batches.append(batch)
+        tickets = rest
+    return batches
+
+
+class BulkUpdateDispatcher:
+    # Collects sends that come due together and flushes them as update_many calls,
+    # grouped by account and compatible payload (status, public flag)
+    def __init__(self, window_seconds=BULK_WINDOW_SECONDS):
+        self.enabled = False
+        self.window_seconds = window_seconds
+        self._pending = {}
+        self._accounts = {}  # Newest copy of each account with pending sends
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def submit(self, account, ticket_id, message, solve_ticket, public_reply, check_last=False, original_fingerprint=""):
+        if not str(ticket_id).isdigit():
+            send_message(account, ticket_id, message, solve_ticket, public_reply, check_last, original_fingerprint)
+            return
+
+        key = (account.name, solve_ticket, public_reply)
+        with self._lock:
+            self._accounts[account.name] = account
+            self._pending.setdefault(key, []).append((str(ticket_id), message, check_last, original_fingerprint))
+            if self._timer is None:
+                self._timer = threading.Timer(self.window_seconds, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            pending_accounts, self._accounts = self._accounts, {}
+            self._timer = None
+
+        for (name, solve_ticket, public_reply), tickets in pending.items():
+            for batch in split_bulk_batches(tickets):
+                send_bulk_update(pending_accounts[name], batch, solve_ticket, public_reply)
+
+
+bulk_dispatcher = BulkUpdateDispatcher()
+
+
+def send_message_to_ticket(
+    account,
+    ticket_id,
+    message,
+    original_fingerprint,
+    check_last,
+    solve_ticket,
+    public_reply,
+):
+    if check_last:
+        current_fingerprint = get_last_comment_fingerprint(
+            account, ticket_id, legacy=original_fingerprint.startswith("text:")
+        )
+
+        # 🔍 Debug prints to help verify the comparison
+        print(f"[DEBUG] Saved fingerprint: {original_fingerprint!r} | Current: {current_fingerprint!r}")
+
+        # ✅ Compare fingerprints; a failed fetch counts as changed
+        if current_fingerprint != original_fingerprint:
+            print(
+                f"[SKIPPED] Ticket #{ticket_id} changed since scheduling. Not sending."
+            )
+            metrics.inc("sends_total", outcome="skipped_changed")
+            return
+
+    if bulk_dispatcher.enabled:
+        bulk_dispatcher.submit(
+            account, ticket_id, message, solve_ticket, public_reply, check_last, original_fingerprint
+        )
+        return
+
+    send_message(
+        account, ticket_id, message, solve_ticket, public_reply,
+        check_last, original_fingerprint,
+    )
+
+
+# --- Async send engine ---
+class AsyncSendEngine:
+    # Runs sends as coroutines on a private event loop, so a burst of due jobs
+    # doesn't hold scheduler worker threads while waiting on Zendesk
+    def __init__(self, concurrency=ASYNC_SEND_CONCURRENCY):
+        self.enabled = False
+        self.concurrency = concurrency
+        self._loop = None
+        self._semaphore = None
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def _ensure_loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._semaphore = asyncio.Semaphore(self.concurrency)
+                threading.Thread(target=self._loop.run_forever, daemon=True).start()
+        return self._loop
+
+    def submit(self, *args):
+        return asyncio.run_coroutine_threadsafe(self._run(*args), self._ensure_loop())
+
+    def _client(self, account):
+        key = (account.name, account.base_url, account.email, account.password)
+        client = self._clients.get(key)
+        if client is None:
+            client = httpx.AsyncClient(
+                base_url=f"{account.base_url}/api/v2/",
+                auth=(account.email, account.password),
+                headers={
+                    "Content-Type": "application/json",
+                    "Accept": "application/json",
+                    "X-Requested-With": "XMLHttpRequest",
+                    "User-Agent": REAL_USER_AGENT,
+                },
+                limits=httpx.Limits(
+                    max_connections=self.concurrency,
+                    max_keepalive_connections=self.concurrency,
+                ),
+                timeout=ZENDESK_TIMEOUT,
+            )
+            self._clients[key] = client
+        return client
+
+    async def _run(
+        self,
+        account,
+        ticket_id,
+        message,
+        original_fingerprint,
+        check_last,
+        solve_ticket,
+        public_reply,
+    ):
+        async with self._semaphore:
+            # Without httpx (or for legacy text fingerprints) fall back to the blocking path in a thread
+            if httpx is None or original_fingerprint.startswith("text:"):
+                await asyncio.to_thread(
+                    send_message_to_ticket,
+                    account,
+                    ticket_id,
+                    message,
+                    original_fingerprint,
+                    check_last,
+                    solve_ticket,
+                    public_reply,
+                )
+                return
+
+            client = self._client(account)
+            try:
+                if check_last:
+                    current_fingerprint = await self._fetch_fingerprint(account, client, ticket_id)
+                    print(f"[DEBUG] Saved fingerprint: {original_fingerprint!r} | Current: {current_fingerprint!r}")
+                    if current_fingerprint != original_fingerprint:
+                        print(f"[SKIPPED] Ticket #{ticket_id} changed since scheduling. Not sending.")
+                        metrics.inc("sends_total", outcome="skipped_changed")
+                        return
+
+                if bulk_dispatcher.enabled:
+                    bulk_dispatcher.submit(
+                        account, ticket_id, message, solve_ticket, public_reply, check_last, original_fingerprint
+                    )
+                    return
+
+                await self._send(
+                    account, client, ticket_id, message, solve_ticket, public_reply, check_last, original_fingerprint
+                )
+            except Exception as e:
+                print(f"[ASYNC EXCEPTION] Error while sending to ticket #{ticket_id}: {e}")
+                await asyncio.to_thread(
+                    retry_queue.failed, account, ticket_id, message, solve_ticket, public_reply, str(e),
+                    None, 1, check_last, original_fingerprint,
+                )
+
+    async def _request(self, account, client, method, path, **kwargs):
+        governor = accounts.governor(account.name)
+        for attempt in range(RATE_LIMIT_MAX_RETRIES + 1):
+            await asyncio.sleep(governor.reserve())
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, path, **kwargs)
+            except Exception:
+                record_zendesk_call(account.name, method, path, "error", time.perf_counter() - start)
+                raise
+            record_zendesk_call(account.name, method, path, response.status_code, time.perf_counter() - start)
+            governor.update_from_headers(response.headers)
+            if response.status_code != 429 or attempt == RATE_LIMIT_MAX_RETRIES:
+                return response
+
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            print(f"[RATE LIMIT] 429 on {path}, queueing for {retry_after:.0f}s")
+            governor.pause(retry_after)
+
+    async def _fetch_fingerprint(self, account, client, ticket_id):
+        response = await self._request(
+            account,
+            client,
+            "GET",
+            f"tickets/{ticket_id}/comments.json",
+            params={"sort": "-created_at", "page[size]": 1},
+        )
+        if response.status_code != 200:
+            print(f"[ERROR] Comment fetch for ticket {ticket_id} failed: {response.status_code}")
+            return None
+        comments = response.json().get("comments", [])
+        return comment_fingerprint(comments[0] if comments else None)
+
+    async def _send(self, account, client, ticket_id, message, solve_ticket, public_reply, check_last, original_fingerprint):
+        path = f"tickets/{ticket_id}.json"
+        payload = {"ticket": build_ticket_update(message, solve_ticket, public_reply)}
+
+        response = await self._request(account, client, "PUT", path, content=json.dumps(payload))
+        now_time = datetime.now().strftime("%H:%M:%S")
+
+        if response.status_code == 200:
+            # Logging touches Tk and Telegram, keep it off the event loop
+            await asyncio.to_thread(log_sent_ticket, account, ticket_id, solve_ticket, public_reply, now_time)
+            return
+
+        print(f"[ERROR] Failed to update ticket #{ticket_id}: {response.status_code}")
+        print(f"[DETAILS] {response.text}")
+
+        if response.status_code == 422:
+            print("[INFO] Retrying with plain text body...")
+            metrics.inc("zendesk_plain_text_retries_total")
+            payload["ticket"] = build_ticket_update(message, solve_ticket, public_reply, plain_text=True)
+
+            retry_response = await self._request(account, client, "PUT", path, content=json.dumps(payload))
+            if retry_response.status_code == 200:
+                await asyncio.to_thread(
+                    log_sent_ticket, account, ticket_id, solve_ticket, public_reply, now_time, True
+                )
+                return
+            print(f"[RETRY ERROR] {retry_response.status_code}: {retry_response.text}")
+            response = retry_response
+
+        await asyncio.to_thread(
+            retry_queue.failed, account, ticket_id, message, solve_ticket, public_reply,
+            f"HTTP {response.status_code}", response.status_code, 1, check_last, original_fingerprint,
+        )
+
+
+async_engine = AsyncSendEngine()
+
+
+def set_credentials(email, password, account=DEFAULT_ACCOUNT):
+    return accounts.set(account, email=email, password=password)
+
+
+def schedule_send(job):
+    # Args must pickle into the job store, so pass plain job data (never credentials)
+    scheduler.add_job(
+        run_scheduled_job,
+        "date",
+        run_date=job.time,
+        args=[job.to_dict()],
+        id=job.job_id,
+        executor=SEND_EXECUTOR,
+        replace_existing=True,
+    )
+
+
+def run_scheduled_job(job):
+    registry.fired(job["job_id"])
+    if isinstance(job.get("time"), datetime):
+        metrics.observe("scheduler_lag_seconds", max(0.0, (datetime.now() - job["time"]).total_seconds()))
+    account = accounts.get(job.get("account"))
+    if account is None:
+        print(f"[ERROR] Ticket #{job['ticket']} not sent: unknown Zendesk account {job['account']!r}")
+        retry_queue.bury_job(registry.get(job["job_id"]) or JobRecord.from_dict(job), f"unknown account {job['account']!r}")
+        return
+    if not account.ready():
+        # Typically right after a restart: keep the job until credentials are entered
+        print(f"[WAIT] No Zendesk credentials yet for {account.name}, ticket #{job['ticket']}; retrying in {CREDENTIALS_WAIT_SECONDS}s")
+        retry_time = datetime.now() + timedelta(seconds=CREDENTIALS_WAIT_SECONDS)
+        record = registry.get(job["job_id"])
+        if record is not None:
+            schedule_send(registry.update(record.job_id, time=retry_time))
+        else:
+            schedule_send(JobRecord.from_dict(dict(job, time=retry_time)))
+        return
+
+    record = registry.get(job["job_id"]) or JobRecord.from_dict(job)
+    try:
+        message = render_job_message(record, account)
+    except KeyError as e:
+        print(f"[ERROR] Ticket #{record.ticket} not sent: {e}")
+        retry_queue.bury_job(record, str(e))
+        return
+
+    dispatch_send(
+        account,
+        record.ticket,
+        message,
+        record.last_comment_fp,
+        record.check_last,
+        record.solve_ticket,
+        record.public_reply,
+    )
+
+
+def log_missed_job(event):
+    print(f"[MISFIRE] Job {event.job_id} missed its run time ({event.scheduled_run_time}), dropped.")
+
+
+def restore_jobs_from_store():
+    # Rebuild the scheduled/manual lists from jobs that survived a restart; their
+    # message templates and the dead letters live in the snapshot + journal
+    data = journal.load()
+    templates.load(data["templates"])
+    retry_queue.load(data["dead_letters"])
+    for aps_job in scheduler.get_jobs():
+        if aps_job.func is not run_scheduled_job or not (aps_job.args and isinstance(aps_job.args[0], dict)):
+            continue
+        registry.add(JobRecord.from_dict(aps_job.args[0]))
+
+    if scheduled_times:
+        print(f"[RESTORE] {len(scheduled_times)} pending jobs restored from {JOB_STORE_FILE}.")
+
+
+def restore_job_state():
+    # Startup: the snapshot + journal are the full record (queue, history, sent log);
+    # the job store alone is only enough when nothing was ever saved
+    if has_saved_jobs():
+        # Jobs the store survived with stay as they are; one SELECT beats re-adding thousands
+        load_job_state(job_store.job_ids())
+    else:
+        restore_jobs_from_store()
+        journal.synced = True
+    scheduler.resume()  # Started paused; see start_scheduler
+
+
+def start_scheduler(send_workers=SLOT_SEND_CONCURRENCY):
+    # Sends get their own bounded pool, so a full slot runs in parallel without
+    # starving the scheduler's other work
+    scheduler.add_executor(SchedulerThreadPool(send_workers), SEND_EXECUTOR)
+    scheduler.add_listener(log_missed_job, EVENT_JOB_MISSED)
+    # Paused until restore_job_state has loaded the templates, or jobs that came due
+    # during downtime would fire at once and find none
+    scheduler.start(paused=True)
+
+
+def dispatch_send(*args):
+    # Entry point for scheduled jobs: hand off to the async engine when it's on
+    if async_engine.enabled:
+        async_engine.submit(*args)
+    else:
+        send_message_to_ticket(*args)
+
+
+# Gauges are read when the metrics are rendered
+for _state in JOB_STATES:
+    metrics.gauge(f"jobs_{_state}", f"Jobs in the {_state} list", functools.partial(registry.count, _state))
+metrics.gauge("jobs_pending_run_times", "Scheduled run times still to fire", lambda: len(scheduled_times))
+metrics.gauge("dead_letters", "Sends waiting in the dead-letter list", lambda: len(retry_queue.dead_letters()))
+metrics.gauge("telegram_queue_size", "Telegram notifications waiting to be sent", telegram_notifier._queue.qsize)
+for _key in ("limit", "used", "waiting", "throttled", "paused_for"):
+    metrics.gauge(
+        f"zendesk_governor_{_key}",
+        f"Zendesk rate-limit governor per account: {_key}",
+        lambda key=_key: {name: accounts.governor(name).usage()[key] for name in accounts.names()},
+        label="account",
+    )